@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 {
     'name': 'MJB - Purchase Downpayment',
-    'version': '17.0.0.3',
+    'version': '17.0.0.5',
     'author': 'Majorbird',
     'website': 'https://majorbird.cn',
     'category': 'Inventory/Purchase',
@@ -16,9 +16,14 @@
     ],
     "data": [
         "security/ir.model.access.csv",
+        "data/ir_cron_data.xml",
         "views/res_config_views.xml",
         "views/purchase.xml",
+        "views/purchase_billing_job_views.xml",
+        "views/purchase_downpayment_ledger_views.xml",
+        "views/purchase_billing_stat_views.xml",
         "wizard/purchase_make_invoice_advance_views.xml",
+        "report/purchase_downpayment_report_views.xml",
     ],
     'css': [],
     'js': [],
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import logging
+
+from odoo import api, SUPERUSER_ID
+from odoo.tools import split_every
+
+_logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+def migrate(cr, version):
+    """ Backfill the stored billed/unbilled balances of the billed purchase lines. """
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    cr.execute("""
+        SELECT DISTINCT aml.purchase_line_id
+          FROM account_move_line aml
+          JOIN account_move am ON am.id = aml.move_id
+         WHERE aml.purchase_line_id IS NOT NULL
+           AND am.state = 'posted'
+           AND am.move_type IN ('in_invoice', 'in_refund')
+      ORDER BY aml.purchase_line_id
+    """)
+    line_ids = [row[0] for row in cr.fetchall()]
+    PurchaseOrderLine = env['purchase.order.line']
+    PurchaseOrder = env['purchase.order']
+    line_fields_to_compute = [
+        PurchaseOrderLine._fields['amount_billed'],
+        PurchaseOrderLine._fields['amount_to_bill'],
+    ]
+    order_fields_to_compute = [
+        PurchaseOrder._fields['amount_billed'],
+        PurchaseOrder._fields['amount_to_bill'],
+    ]
+    for batch_index, ids in enumerate(split_every(BATCH_SIZE, line_ids), start=1):
+        lines = PurchaseOrderLine.browse(ids)
+        for field in line_fields_to_compute:
+            env.add_to_compute(field, lines)
+        # A queued recompute does not mark the dependent fields: queue the orders too, they
+        # are recomputed after their lines.
+        for field in order_fields_to_compute:
+            env.add_to_compute(field, lines.order_id)
+        env.flush_all()
+        env.invalidate_all()
+        _logger.info(
+            "Billed balances: %s/%s purchase order lines recomputed",
+            min(batch_index * BATCH_SIZE, len(line_ids)), len(line_ids),
+        )
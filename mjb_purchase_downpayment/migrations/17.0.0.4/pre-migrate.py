@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo.tools.sql import column_exists, create_column
+
+
+def migrate(cr, version):
+    """ Create the billed/unbilled balance columns before the registry loads them.
+
+    When the ORM creates a new stored computed column itself, it recomputes it for
+    every record of the table in a single pass. We create the columns here and seed
+    them with the "nothing billed yet" values; the post-migration then recomputes only
+    the lines that are actually linked to vendor bills, in batches.
+    """
+    for table in ('purchase_order_line', 'purchase_order'):
+        for column in ('amount_billed', 'amount_to_bill'):
+            if not column_exists(cr, table, column):
+                create_column(cr, table, column, 'numeric')
+
+    cr.execute("""
+        UPDATE purchase_order_line
+           SET amount_billed = 0.0,
+               amount_to_bill = COALESCE(price_total, 0.0)
+    """)
+    cr.execute("""
+        UPDATE purchase_order po
+           SET amount_billed = 0.0,
+               amount_to_bill = COALESCE(totals.amount_to_bill, 0.0)
+          FROM (
+                SELECT order_id, SUM(amount_to_bill) AS amount_to_bill
+                  FROM purchase_order_line
+              GROUP BY order_id
+          ) AS totals
+         WHERE totals.order_id = po.id
+    """)
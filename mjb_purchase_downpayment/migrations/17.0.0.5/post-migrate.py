@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import logging
+
+from odoo import api, SUPERUSER_ID
+from odoo.tools import split_every
+
+_logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+def migrate(cr, version):
+    """ Fill the down payment ledger from the existing down payment bills. """
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    cr.execute("""
+        SELECT DISTINCT aml.move_id
+          FROM account_move_line aml
+          JOIN account_move am ON am.id = aml.move_id
+          JOIN purchase_order_line pol ON pol.id = aml.purchase_line_id
+         WHERE pol.mjb_is_downpayment
+           AND am.state != 'cancel'
+           AND am.move_type IN ('in_invoice', 'in_refund')
+      ORDER BY aml.move_id
+    """)
+    move_ids = [row[0] for row in cr.fetchall()]
+    Ledger = env['purchase.downpayment.ledger']
+    for batch_index, ids in enumerate(split_every(BATCH_SIZE, move_ids), start=1):
+        moves = env['account.move'].browse(ids)
+        Ledger._log_raised(moves)
+        Ledger._log_posted(moves)
+        env.flush_all()
+        env.invalidate_all()
+        _logger.info(
+            "Down payment ledger: %s/%s bills recorded",
+            min(batch_index * BATCH_SIZE, len(move_ids)), len(move_ids),
+        )
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo.tools.sql import column_exists, create_column
+
+DOWN_PAYMENT_TOTAL_COLUMNS = (
+    'mjb_down_payment_raised',
+    'mjb_down_payment_posted',
+    'mjb_down_payment_deducted',
+    'mjb_down_payment_outstanding',
+)
+
+
+def migrate(cr, version):
+    """ Create the automatic billing marker and the down payment totals before the registry
+    loads them, so that the ORM neither marks all the existing orders to bill again nor
+    computes the totals of every order in a single pass.
+
+    The totals start at 0: the post-migration fills the ledger, which recomputes the totals
+    of the orders with down payments only.
+    """
+    if not column_exists(cr, 'purchase_order', 'mjb_billing_dirty'):
+        create_column(cr, 'purchase_order', 'mjb_billing_dirty', 'boolean')
+    for column in DOWN_PAYMENT_TOTAL_COLUMNS:
+        if not column_exists(cr, 'purchase_order', column):
+            # Adding the column with a constant default does not rewrite the table
+            cr.execute(f'ALTER TABLE purchase_order ADD COLUMN "{column}" numeric DEFAULT 0')
+            cr.execute(f'ALTER TABLE purchase_order ALTER COLUMN "{column}" DROP DEFAULT')
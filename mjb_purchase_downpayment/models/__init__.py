@@ -1,4 +1,10 @@
+from . import product
 from . import res_company
 from . import res_config
 from . import purchase
 from . import account_invoice
+from . import account_tax
+from . import purchase_billing_job
+from . import purchase_downpayment_ledger
+from . import purchase_downpayment_milestone
+from . import purchase_billing_stat
@@ -1,21 +1,215 @@
 # -*- coding: utf-8 -*-
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
+import math
+from collections import defaultdict
+
 from odoo import api, fields, models, _
+from odoo.fields import Command
+from odoo.tools import float_round
+from odoo.tools.sql import create_index
+
+DEFERRED_CHATTER_KEY = 'mjb_purchase_downpayment.deferred_chatter'
 
 
 class AccountMove(models.Model):
     _inherit = 'account.move'
 
     def unlink(self):
-        downpayment_lines = self.mapped('line_ids.purchase_line_id').filtered(lambda line: line.mjb_is_downpayment)
+        self.env['purchase.downpayment.ledger']._log_cancelled(self)
+        # The quantities of the deleted bills are to bill again
+        self.line_ids.purchase_line_id.order_id.mjb_billing_dirty = True
+        downpayment_lines = self.line_ids.purchase_line_id.filtered(lambda line: line.mjb_is_downpayment)
         res = super(AccountMove, self).unlink()
-        for downpayment_line in downpayment_lines:
+        if downpayment_lines:
             # As we can't use odoo unlink (Blocked by the purchase state, we need to force it by cr)
-            account_move = self.env['account.move'].search([('line_ids.purchase_line_id.id', 'in', [downpayment_line.id]), ('state', '=', 'posted')])
-            if len(account_move) == 0:
-                query = """
-                DELETE FROM purchase_order_line
-                WHERE id = %s""" % downpayment_line.id
-                self.env.cr.execute(query)
+            # Only the down payment lines no longer billed on any posted move are removed.
+            self.env['account.move'].flush_model(['state'])
+            self.env['account.move.line'].flush_model(['move_id', 'purchase_line_id'])
+            self.env.cr.execute("""
+                SELECT DISTINCT aml.purchase_line_id
+                  FROM account_move_line aml
+                  JOIN account_move am ON am.id = aml.move_id
+                 WHERE aml.purchase_line_id = ANY(%s)
+                   AND am.state = 'posted'
+            """, [downpayment_lines.ids])
+            posted_line_ids = {line_id for line_id, in self.env.cr.fetchall()}
+            lines_to_delete = downpayment_lines.filtered(lambda line: line.id not in posted_line_ids)
+            if lines_to_delete:
+                orders = lines_to_delete.order_id
+                self.env.cr.execute("DELETE FROM purchase_order_line WHERE id = ANY(%s)", [lines_to_delete.ids])
+                lines_to_delete.invalidate_recordset()
+                # Bill lines still referencing them were set to null by the foreign key
+                self.env['account.move.line'].invalidate_model(['purchase_line_id'])
+                orders.invalidate_recordset(['order_line'])
+                # Recompute what depends on the order lines of the orders (totals, balances, ...)
+                orders.modified(['order_line'])
+        return res
+
+    def _post(self, soft=True):
+        posted = super()._post(soft)
+        self.env['purchase.downpayment.ledger']._log_posted(posted)
+        return posted
+
+    def button_draft(self):
+        res = super().button_draft()
+        self.env['purchase.downpayment.ledger']._log_cancelled(self, ('posted', 'deducted'))
+        return res
+
+    def button_cancel(self):
+        res = super().button_cancel()
+        self.env['purchase.downpayment.ledger']._log_cancelled(self)
+        self.line_ids.purchase_line_id.order_id.mjb_billing_dirty = True
         return res
+
+    #=== ROUNDING ===#
+
+    @api.model
+    def _allocate_rounding_delta(self, delta_amount, currency, count, weights=None):
+        """ Split `delta_amount` in `count` amounts, in units of the `currency` rounding.
+
+        The delta is converted to a whole number of units and allocated in a single pass by
+        the largest remainder method: each amount receives the integer part of its share,
+        and the units left go to the largest remainders, the first amounts on ties. With
+        equal weights, the amounts thus differ by at most one unit, and a delta of `k`
+        units, `k <= count`, gives one unit to each of the `k` first amounts.
+
+        :param float delta_amount: the amount to allocate
+        :param currency: `res.currency` record whose rounding is the allocated unit
+        :param int count: the number of amounts
+        :param list weights: optional weight of each amount, equal weights by default
+        :return: `count` amounts, summing up to `delta_amount` rounded to the currency
+        :rtype: list
+        """
+        if not count:
+            return []
+        sign = -1 if delta_amount < 0 else 1
+        units = int(float_round(abs(delta_amount) / currency.rounding, precision_rounding=1))
+        weights = weights if weights and any(weights) else [1] * count
+        total_weight = sum(weights)
+        shares = [units * weight / total_weight for weight in weights]
+        allocated = [math.floor(share) for share in shares]
+        by_remainder = sorted(range(count), key=lambda index: allocated[index] - shares[index])
+        for index in by_remainder[:units - sum(allocated)]:
+            allocated[index] += 1
+        return [currency.round(sign * unit * currency.rounding) for unit in allocated]
+
+    def _get_rounding_delta_commands(self, delta_amount, balance_line, lines_to_adjust):
+        """ Return the commands adding `delta_amount` to `balance_line` and spreading it over
+        the lines to adjust, see :meth:`_allocate_rounding_delta`.
+
+        :param float delta_amount: the rounding delta of the move `self`
+        :param balance_line: `account.move.line` receiving the whole delta
+        :param list lines_to_adjust: (lines, field name, sign) triplets, the delta is spread
+            over each of the `lines`, on their given field, multiplied by `sign`
+        :return: `line_ids` commands, to write in one go
+        :rtype: list
+        """
+        self.ensure_one()
+        line_commands = [Command.update(balance_line.id, {
+            'amount_currency': balance_line.amount_currency + delta_amount,
+        })]
+        for lines, fname, sign in lines_to_adjust:
+            amounts = self._allocate_rounding_delta(delta_amount, self.currency_id, len(lines))
+            line_commands.extend(
+                Command.update(line.id, {fname: line[fname] + amount * sign})
+                for line, amount in zip(lines, amounts)
+                if amount
+            )
+        return line_commands
+
+    #=== CHATTER ===#
+
+    def _message_post_origin_links(self, origins=None):
+        """ Post the `mail.message_origin_link` note on each move of `self`, in batch.
+
+        The note is rendered once per distinct set of origin orders and all messages are
+        created at once. Mass runs can set the `mjb_chatter` context key to 'skip' to post
+        nothing, or to 'defer' to post the notes of the whole transaction right before commit.
+
+        :param dict origins: origin `purchase.order` per move, the orders of its lines by default
+        """
+        mode = self.env.context.get('mjb_chatter')
+        if not self or mode == 'skip':
+            return
+        origins = {
+            move: origins[move] if origins and move in origins else move.line_ids.purchase_line_id.order_id
+            for move in self
+        }
+        if mode == 'defer':
+            deferred_origin_links = self._get_deferred_chatter()['origin_links']
+            for move, origin in origins.items():
+                deferred_origin_links[move.id] = origin.ids
+            return
+
+        bodies = {}
+        rendered_bodies = {}
+        for move, origin in origins.items():
+            origin_key = tuple(origin.ids)
+            if origin_key not in rendered_bodies:
+                # The template only reads the model of `self`, the body only depends on the origin.
+                rendered_bodies[origin_key] = self.env['ir.qweb']._render(
+                    'mail.message_origin_link',
+                    {'self': move, 'origin': origin},
+                    minimal_qcontext=True,
+                    raise_if_not_found=False,
+                )
+            bodies[move.id] = rendered_bodies[origin_key]
+        self._message_log_batch(
+            bodies=bodies,
+            subtype_id=self.env['ir.model.data']._xmlid_to_res_id('mail.mt_note'),
+        )
+
+    @api.model
+    def _message_log_records(self, records, bodies):
+        """ Log `bodies` (a body per record id) on `records`, honouring the `mjb_chatter` mode. """
+        mode = self.env.context.get('mjb_chatter')
+        if not records or mode == 'skip':
+            return
+        if mode == 'defer':
+            self._get_deferred_chatter()['messages'][records._name].update(bodies)
+            return
+        records._message_log_batch(bodies=bodies)
+
+    @api.model
+    def _get_deferred_chatter(self):
+        data = self.env.cr.precommit.data
+        if DEFERRED_CHATTER_KEY not in data:
+            data[DEFERRED_CHATTER_KEY] = {
+                'origin_links': {},
+                'messages': defaultdict(dict),
+            }
+            self.env.cr.precommit.add(self.with_context(mjb_chatter=False)._flush_deferred_chatter)
+        return data[DEFERRED_CHATTER_KEY]
+
+    @api.model
+    def _flush_deferred_chatter(self):
+        deferred = self.env.cr.precommit.data.pop(DEFERRED_CHATTER_KEY, None)
+        if not deferred:
+            return
+        moves = self.browse(list(deferred['origin_links'])).exists()
+        moves._message_post_origin_links({
+            move: self.env['purchase.order'].browse(deferred['origin_links'][move.id]).exists()
+            for move in moves
+        })
+        for model, bodies in deferred['messages'].items():
+            records = self.env[model].browse(list(bodies)).exists()
+            self._message_log_records(records, {record_id: bodies[record_id] for record_id in records.ids})
+        # Precommit hooks run after the transaction flush
+        self.env.flush_all()
+
+
+class AccountMoveLine(models.Model):
+    _inherit = 'account.move.line'
+
+    def init(self):
+        super().init()
+        # Bills of purchase lines, read without visiting the table, see
+        # purchase.order._get_draft_bill_ids
+        create_index(
+            self.env.cr,
+            'account_move_line_purchase_line_id_move_id_index',
+            self._table,
+            ['purchase_line_id', 'move_id'],
+            where='purchase_line_id IS NOT NULL',
+        )
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo import models
+
+# Fields read by purchase.order._get_down_payment_base_amounts
+DOWN_PAYMENT_BASE_TAX_FIELDS = {
+    'amount', 'amount_type', 'price_include', 'include_base_amount', 'is_base_affected', 'children_tax_ids',
+}
+
+
+class AccountTax(models.Model):
+    _inherit = 'account.tax'
+
+    def write(self, vals):
+        res = super().write(vals)
+        if DOWN_PAYMENT_BASE_TAX_FIELDS.intersection(vals):
+            self.env.registry.clear_cache()
+        return res
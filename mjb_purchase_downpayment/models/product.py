@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo import models
+
+# Fields read by res.company._get_purchase_down_payment_config
+DEPOSIT_CONFIG_TEMPLATE_FIELDS = {'supplier_taxes_id', 'property_account_expense_id', 'categ_id'}
+
+
+class ProductTemplate(models.Model):
+    _inherit = 'product.template'
+
+    def write(self, vals):
+        res = super().write(vals)
+        if DEPOSIT_CONFIG_TEMPLATE_FIELDS.intersection(vals) and self._is_purchase_down_payment_product():
+            self.env.registry.clear_cache()
+        return res
+
+    def _is_purchase_down_payment_product(self):
+        """ Return whether one of the templates is the deposit product of a company. """
+        ResCompany = self.env['res.company']
+        deposit_product_ids = {
+            ResCompany._get_purchase_down_payment_config(company_id)[0]
+            for company_id in ResCompany.sudo().search([]).ids
+        }
+        return bool(deposit_product_ids.intersection(self.with_context(active_test=False).product_variant_ids.ids))
+
+
+class ProductCategory(models.Model):
+    _inherit = 'product.category'
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'property_account_expense_categ_id' in vals:
+            self.env.registry.clear_cache()
+        return res
@@ -1,20 +1,90 @@
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
 from odoo.tools.float_utils import float_compare
 import logging
+import threading
 from odoo.exceptions import AccessError, UserError, ValidationError
-from odoo.tools import float_compare, float_is_zero, float_round
-from itertools import groupby
+from odoo.tools import float_compare, float_is_zero, float_round, frozendict
+from collections import defaultdict
 from odoo.fields import Command
+from odoo.tools.sql import SQL, create_index
+
+from .purchase_downpayment_ledger import ACTIVE_ENTRY_TYPES
 
 _logger = logging.getLogger(__name__)
 
+# Fields of the purchase lines on which the down payment base amounts depend,
+# see purchase.order._get_down_payment_base_amounts
+DOWN_PAYMENT_BASE_LINE_FIELDS = {
+    'order_id', 'display_type', 'mjb_is_downpayment', 'product_id', 'product_qty', 'product_uom',
+    'price_unit', 'discount', 'taxes_id', 'analytic_distribution',
+}
+DOWN_PAYMENT_BASE_ORDER_FIELDS = {'company_id', 'partner_id', 'currency_id', 'fiscal_position_id'}
+
 
 class PurchaseOrder(models.Model):
     _inherit = 'purchase.order'
 
-    amount_to_bill = fields.Monetary(string="Un-billed Balance", compute='_compute_amount_to_invoice')
-    amount_billed = fields.Monetary(string="Already billed", compute='_compute_amount_billed')
-    
+    amount_to_bill = fields.Monetary(string="Un-billed Balance", compute='_compute_amount_to_invoice', store=True)
+    amount_billed = fields.Monetary(string="Already billed", compute='_compute_amount_billed', store=True)
+    mjb_milestone_ids = fields.One2many(
+        comodel_name='purchase.downpayment.milestone', inverse_name='order_id', string="Down Payment Milestones",
+        copy=True)
+    mjb_down_payment_ledger_ids = fields.One2many(
+        comodel_name='purchase.downpayment.ledger', inverse_name='order_id', string="Down Payment Ledger")
+    # Running totals of the ledger, taxes included
+    mjb_down_payment_raised = fields.Monetary(
+        string="Down Payments Raised", compute='_compute_down_payment_totals', store=True)
+    mjb_down_payment_posted = fields.Monetary(
+        string="Down Payments Posted", compute='_compute_down_payment_totals', store=True)
+    mjb_down_payment_deducted = fields.Monetary(
+        string="Down Payments Deducted", compute='_compute_down_payment_totals', store=True)
+    mjb_down_payment_outstanding = fields.Monetary(
+        string="Outstanding Down Payments", compute='_compute_down_payment_totals', store=True)
+    # Set when the received quantities change or when a bill is cancelled, cleared by the
+    # automatic billing, see _cron_auto_bill
+    mjb_billing_dirty = fields.Boolean(
+        string="To Bill Again", compute='_compute_mjb_billing_dirty', store=True, readonly=False,
+        index=True, copy=False)
+    # Taken from a database sequence each time the lines change in a way that affects the
+    # down payment base amounts. Sequence values are never reused, not even after a rollback,
+    # so a cached value computed by another transaction is never mistaken for a current one.
+    mjb_line_version = fields.Integer(string="Lines Version", readonly=True, copy=False)
+
+    @api.depends(
+        'mjb_down_payment_ledger_ids.amount', 'mjb_down_payment_ledger_ids.entry_type',
+        'mjb_down_payment_ledger_ids.is_cancelled',
+    )
+    def _compute_down_payment_totals(self):
+        totals = {}
+        if self._origin:
+            totals = {
+                (order.id, entry_type): amount
+                for order, entry_type, amount in self.env['purchase.downpayment.ledger']._read_group(
+                    [('order_id', 'in', self._origin.ids), ('is_cancelled', '=', False), ('entry_type', '!=', 'cancelled')],
+                    groupby=['order_id', 'entry_type'],
+                    aggregates=['amount:sum'],
+                )
+            }
+        for order in self:
+            order.mjb_down_payment_raised = totals.get((order._origin.id, 'raised'), 0.0)
+            order.mjb_down_payment_posted = totals.get((order._origin.id, 'posted'), 0.0)
+            order.mjb_down_payment_deducted = totals.get((order._origin.id, 'deducted'), 0.0)
+            order.mjb_down_payment_outstanding = order.mjb_down_payment_posted - order.mjb_down_payment_deducted
+
+    @api.depends('state', 'order_line.qty_received')
+    def _compute_mjb_billing_dirty(self):
+        self.mjb_billing_dirty = True
+
+    def init(self):
+        super().init()
+        self.env.cr.execute("CREATE SEQUENCE IF NOT EXISTS purchase_order_mjb_line_version_seq")
+
+    def write(self, vals):
+        res = super().write(vals)
+        if DOWN_PAYMENT_BASE_ORDER_FIELDS.intersection(vals):
+            self._bump_line_version()
+        return res
+
     @api.depends('order_line.amount_to_bill')
     def _compute_amount_to_invoice(self):
         for order in self:
@@ -54,18 +124,235 @@ class PurchaseOrder(models.Model):
     # Do not copy if line is downpayment
 
     def copy_data(self, default=None):
-        if default is None:
-            default = {}
-        if 'order_line' not in default:
-            default['order_line'] = [
-                Command.create(line.copy_data()[0])
-                for line in self.order_line.filtered(lambda l: not l.mjb_is_downpayment)
-            ]
-        return super().copy_data(default)
+        # The values of the lines of all orders are taken with one copy_data call on the
+        # lines, see PurchaseOrderLine.copy_data, each order getting its own defaults.
+        default = dict(default or {})
+        if 'order_line' in default:
+            return [vals for order in self for vals in super(PurchaseOrder, order).copy_data(default)]
+        lines = self.order_line.filtered(lambda l: not l.mjb_is_downpayment)
+        line_commands_per_order = defaultdict(list)
+        for line, line_vals in zip(lines, lines.copy_data()):
+            line_commands_per_order[line.order_id.id].append(Command.create(line_vals))
+        return [
+            vals
+            for order in self
+            for vals in super(PurchaseOrder, order).copy_data({
+                **default,
+                'order_line': line_commands_per_order[order.id],
+            })
+        ]
+
+    def _bump_line_version(self):
+        """ Give a new `mjb_line_version` to the orders of `self`. """
+        order_ids = tuple(self.filtered('id').ids)
+        if not order_ids:
+            return
+        self.env.cr.execute("""
+            UPDATE purchase_order
+               SET mjb_line_version = nextval('purchase_order_mjb_line_version_seq')
+             WHERE id IN %s
+        """, [order_ids])
+        self.invalidate_recordset(['mjb_line_version'])
+
+    def _get_down_payment_base_amounts(self):
+        """ Return the untaxed amounts of the order lines, per taxes and analytic distribution,
+        on which the down payments are computed.
+
+        The amounts are cached until the lines change, see `mjb_line_version`, so that
+        successive down payments on large orders do not compute the taxes of every line
+        again.
+
+        :return: tuple of ((tax ids, analytic distribution), amount) pairs
+        :rtype: tuple
+        """
+        self.ensure_one()
+        if not self.id:
+            return self._compute_down_payment_base_amounts()
+        return self._get_down_payment_base_amounts_cached(self.id, self.mjb_line_version)
+
+    @api.model
+    @tools.ormcache('order_id', 'line_version')
+    def _get_down_payment_base_amounts_cached(self, order_id, line_version):
+        order = self.browse(order_id).sudo()
+        return order.with_company(order.company_id)._compute_down_payment_base_amounts()
+
+    def _compute_down_payment_base_amounts(self):
+        self.ensure_one()
+        order_lines = self.order_line.filtered(lambda l: not l.display_type and not l.mjb_is_downpayment)
+        computed_taxes = self.env['account.tax']._compute_taxes([
+            line._convert_to_tax_base_line_dict()
+            for line in order_lines
+        ])
+
+        base_amounts = defaultdict(float)
+        for line, tax_repartition in computed_taxes['base_lines_to_update']:
+            analytic_distribution = line['analytic_distribution'] and frozendict(line['analytic_distribution'])
+            taxes = line['taxes'].flatten_taxes_hierarchy()
+            tax_indexes = {tax: index for index, tax in enumerate(taxes)}
+            fixed_taxes = taxes.filtered(lambda tax: tax.amount_type == 'fixed')
+            base_amounts[tuple(sorted((taxes - fixed_taxes).ids)), analytic_distribution] += tax_repartition['price_subtotal']
+            for fixed_tax in fixed_taxes:
+                # Fixed taxes cannot be set as taxes on down payments as they always amounts to 100%
+                # of the tax amount. Therefore fixed taxes are removed and are replace by a new line
+                # with appropriate amount, and non fixed taxes if the fixed tax affected the base of
+                # any other non fixed tax.
+                if fixed_tax.price_include:
+                    continue
+
+                if fixed_tax.include_base_amount:
+                    pct_tax = taxes[tax_indexes[fixed_tax] + 1:]\
+                        .filtered(lambda t: t.is_base_affected and t.amount_type != 'fixed')
+                else:
+                    pct_tax = self.env['account.tax']
+                base_amounts[tuple(sorted(pct_tax.ids)), analytic_distribution] += line['quantity'] * fixed_tax.amount
+        return tuple(base_amounts.items())
+
+    def _get_draft_bill_ids(self, limit=None, order_domain=None):
+        """ Return the ids of the draft bills of the orders `self`, queried through the
+        `account_move_line_purchase_line_id_move_id_index` index without loading the bills.
+
+        :param int limit: maximum number of ids to return, `1` is enough to check existence
+        :param list order_domain: domain of the orders to use instead of `self`, searched as a
+            subquery so that the orders are never fetched
+        :rtype: list
+        """
+        if order_domain is not None:
+            order_condition = SQL("pol.order_id IN %s", self.env['purchase.order']._search(order_domain).subselect())
+        elif self.ids:
+            order_condition = SQL("pol.order_id = ANY(%s)", self.ids)
+        else:
+            return []
+        self.env['purchase.order.line'].flush_model(['order_id'])
+        self.env['account.move.line'].flush_model(['move_id', 'purchase_line_id'])
+        self.env['account.move'].flush_model(['state', 'move_type'])
+        query = SQL("""
+            SELECT DISTINCT aml.move_id
+              FROM purchase_order_line pol
+              JOIN account_move_line aml ON aml.purchase_line_id = pol.id
+              JOIN account_move am ON am.id = aml.move_id
+             WHERE %s
+               AND am.state = 'draft'
+               AND am.move_type IN ('in_invoice', 'in_refund')
+        """, order_condition)
+        if limit:
+            query = SQL("%s LIMIT %s", query, limit)
+        self.env.cr.execute(query)
+        return [move_id for move_id, in self.env.cr.fetchall()]
+
+    @api.model
+    def _cron_auto_bill(self, batch_size=None):
+        """ Bill the orders whose received quantities changed since the last run, for the
+        companies with automatic billing. Each batch of orders is committed on its own.
+        """
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        batch_size = batch_size or int(self.env['ir.config_parameter'].sudo().get_param(
+            'mjb_purchase_downpayment.auto_billing_batch_size', 100))
+        for company in self.env['res.company'].search([('purchase_auto_billing', '=', True)]):
+            self.with_company(company)._auto_bill_company(company, batch_size, auto_commit)
+
+    @api.model
+    def _auto_bill_company(self, company, batch_size, auto_commit=True):
+        """ Bill the dirty orders of `company`, by batches of `batch_size` orders.
+
+        The orders of a batch are billed together with the company settings, in a savepoint:
+        when their bills cannot be created, the batch is logged and its orders stay dirty
+        for the next run.
+
+        :return: the created bills
+        :rtype: `account.move` recordset
+        """
+        moves = self.env['account.move']
+        last_id = 0
+        while True:
+            orders = self.search([
+                ('company_id', '=', company.id),
+                ('mjb_billing_dirty', '=', True),
+                ('id', '>', last_id),
+            ], order='id', limit=batch_size)
+            if not orders:
+                break
+            last_id = orders[-1].id
+            orders_to_bill = orders.filtered(lambda order: order.state in ('purchase', 'done') and order.invoice_status == 'to invoice')
+            try:
+                with self.env.cr.savepoint():
+                    moves |= orders_to_bill.with_context(raise_if_nothing_to_invoice=False)._create_invoices(
+                        grouped=not company.purchase_auto_billing_consolidated,
+                        final=company.purchase_auto_billing_final,
+                    )
+                    orders.mjb_billing_dirty = False
+            except Exception:
+                self.env.invalidate_all(flush=False)
+                _logger.warning("Automatic billing of the purchase orders %s failed", orders_to_bill.ids, exc_info=True)
+            if auto_commit:
+                self.env.cr.commit()
+        return moves
 
     def _get_invoice_grouping_keys(self):
         return ['company_id', 'partner_id', 'currency_id']
 
+    @api.model
+    @tools.ormcache('company_id')
+    def _get_bill_grouping_fnames(self, company_id):
+        """ Return the bill fields grouping the orders of `company_id` on consolidated bills:
+        the :meth:`_get_invoice_grouping_keys`, followed by the extra grouping fields of
+        the company.
+
+        :rtype: tuple
+        """
+        grouping_keys = list(self._get_invoice_grouping_keys())
+        if company_id:
+            for fname in self.env['res.company'].browse(company_id).sudo().purchase_bill_grouping_field_ids.mapped('name'):
+                if fname not in grouping_keys:
+                    grouping_keys.append(fname)
+        return tuple(grouping_keys)
+
+    def _get_bill_grouping_key(self, bill_vals):
+        """ Return the grouping values of the bill values `bill_vals`.
+
+        :rtype: tuple
+        """
+        return tuple(bill_vals.get(fname) for fname in self._get_bill_grouping_fnames(bill_vals.get('company_id')))
+
+    def _group_bill_vals(self, bill_vals_list):
+        """ Merge the bill values sharing the same grouping values, see :meth:`_get_bill_grouping_key`.
+
+        Bills are grouped in a dict, in a single pass: the bill values of the first order of
+        a group receive the lines of the next ones. The groups keep the order of their first
+        order.
+
+        :param list bill_vals_list: `account.move` creation values, one per order
+        :return: `account.move` creation values, one per group
+        :rtype: list
+        """
+        groups = {}
+        for invoice_vals in bill_vals_list:
+            grouping_key = self._get_bill_grouping_key(invoice_vals)
+            group = groups.get(grouping_key)
+            if group is None:
+                groups[grouping_key] = group = {
+                    'vals': invoice_vals,
+                    'origins': {},
+                    'payment_refs': {},
+                    'refs': {},
+                }
+            else:
+                group['vals']['invoice_line_ids'].extend(invoice_vals['invoice_line_ids'])
+            group['origins'][invoice_vals['invoice_origin']] = True
+            group['payment_refs'][invoice_vals['payment_reference']] = True
+            group['refs'][invoice_vals['ref']] = True
+
+        new_bill_vals_list = []
+        for group in groups.values():
+            ref_invoice_vals = group['vals']
+            payment_refs = list(group['payment_refs'])
+            ref_invoice_vals.update({
+                'ref': ', '.join(group['refs'])[:2000],
+                'invoice_origin': ', '.join(group['origins']),
+                'payment_reference': len(payment_refs) == 1 and payment_refs[0] or False,
+            })
+            new_bill_vals_list.append(ref_invoice_vals)
+        return new_bill_vals_list
+
     def _nothing_to_invoice_error(self):
         msg = _("""There is nothing to bill!\n
 Reason(s) of this behavior could be:
@@ -76,30 +363,47 @@ Reason(s) of this behavior could be:
 
     def _get_invoiceable_lines(self, final=False):
         """Return the billable lines for order `self`."""
-        down_payment_line_ids = []
-        invoiceable_line_ids = []
-        pending_section = None
+        return self.env['purchase.order.line'].concat(*self._get_invoiceable_lines_per_order(final).values())
+
+    def _get_invoiceable_lines_per_order(self, final=False):
+        """ Return the billable lines of every order of `self`, computed in a single pass.
+
+        The fields deciding whether a line is billable are fetched for the lines of all
+        orders at once, instead of order per order.
+
+        :param bool final: if True, lines with a negative quantity to bill are billable
+        :return: the billable lines, down payment lines last, per order id
+        :rtype: dict
+        """
         precision = self.env['decimal.precision'].precision_get('Product Unit of Measure')
+        self.order_line.fetch(['display_type', 'qty_to_invoice', 'mjb_is_downpayment'])
 
-        for line in self.order_line:
-            if line.display_type == 'line_section':
-                # Only bill the section if one of its lines is invoiceable
-                pending_section = line
-                continue
-            if line.display_type != 'line_note' and float_is_zero(line.qty_to_invoice, precision_digits=precision):
-                continue
-            if line.qty_to_invoice > 0 or (line.qty_to_invoice < 0 and final) or line.display_type == 'line_note':
-                if line.mjb_is_downpayment:
-                    # Keep down payment lines separately, to put them together
-                    # at the end of the bill, in a specific dedicated section.
-                    down_payment_line_ids.append(line.id)
+        invoiceable_lines_per_order = {}
+        for order in self:
+            down_payment_line_ids = []
+            invoiceable_line_ids = []
+            pending_section = None
+            for line in order.order_line:
+                if line.display_type == 'line_section':
+                    # Only bill the section if one of its lines is invoiceable
+                    pending_section = line
                     continue
-                if pending_section:
-                    invoiceable_line_ids.append(pending_section.id)
-                    pending_section = None
-                invoiceable_line_ids.append(line.id)
-
-        return self.env['purchase.order.line'].browse(invoiceable_line_ids + down_payment_line_ids)
+                if line.display_type != 'line_note' and float_is_zero(line.qty_to_invoice, precision_digits=precision):
+                    continue
+                if line.qty_to_invoice > 0 or (line.qty_to_invoice < 0 and final) or line.display_type == 'line_note':
+                    if line.mjb_is_downpayment:
+                        # Keep down payment lines separately, to put them together
+                        # at the end of the bill, in a specific dedicated section.
+                        down_payment_line_ids.append(line.id)
+                        continue
+                    if pending_section:
+                        invoiceable_line_ids.append(pending_section.id)
+                        pending_section = None
+                    invoiceable_line_ids.append(line.id)
+            invoiceable_lines_per_order[order.id] = self.env['purchase.order.line'].browse(
+                invoiceable_line_ids + down_payment_line_ids
+            )
+        return invoiceable_lines_per_order
 
     def _prepare_down_payment_section_line(self, **optional_values):
         """ Prepare the values to create a new down payment section.
@@ -146,21 +450,173 @@ Reason(s) of this behavior could be:
         :rtype: `account.move` recordset
         :raises: UserError if one of the orders has no invoiceable lines.
         """
+        if not self._check_bill_creation_access():
+            return self.env['account.move']
+        profiler = self.env['purchase.billing.stat']._profiler('create_invoices', len(self))
+
+        # 1) Create invoices.
+        with profiler.phase('invoiceable_lines') as phase:
+            invoiceable_lines_per_order = self._get_invoiceable_lines_per_order(final)
+            phase['rows'] = sum(len(lines) for lines in invoiceable_lines_per_order.values())
+        with profiler.phase('prepare_values') as phase:
+            bill_vals_list = self._prepare_bill_vals_list(final, invoiceable_lines_per_order)
+            phase['rows'] = len(bill_vals_list)
+
+        if not bill_vals_list and self._context.get('raise_if_nothing_to_invoice', True):
+            raise UserError(self._nothing_to_invoice_error_message())
+
+        # 2) Manage 'grouped' parameter: group by (partner_id, currency_id).
+        if not grouped:
+            with profiler.phase('grouping') as phase:
+                bill_vals_list = self._group_bill_vals(bill_vals_list)
+                phase['rows'] = len(bill_vals_list)
+
+        # 3) Create invoices.
+        if len(bill_vals_list) < len(self):
+            with profiler.phase('resequencing') as phase:
+                self._resequence_bill_vals(bill_vals_list)
+                phase['rows'] = sum(len(bill_vals['invoice_line_ids']) for bill_vals in bill_vals_list)
+
+        # Manage the creation of invoices in sudo because a salesperson must be able to generate an bill from a
+        # purchase order without "billing" access rights. However, he should not be able to create an bill from scratch.
+        with profiler.phase('move_create') as phase:
+            moves = self.env['account.move'].sudo().with_context(default_move_type='in_invoice').create(bill_vals_list)
+            phase['rows'] = len(moves)
+
+        # 4) Some moves might actually be refunds: convert them if the total amount is negative
+        self._post_process_bills(moves, final, profiler)
+        profiler.save()
+        return moves
+
+    def _create_invoices_streamed(self, grouped=False, final=False, chunk_size=None, use_savepoint=False):
+        """ Create bill(s) for the given Purchase Order(s), with a bounded memory footprint.
+
+        Same as :meth:`_create_invoices`, but the bill values are generated one group of
+        orders at a time, and the bills are created by chunks of `chunk_size` bills. The
+        cache is flushed and cleared after each chunk.
+
+        :param bool grouped: see :meth:`_create_invoices`
+        :param bool final: see :meth:`_create_invoices`
+        :param int chunk_size: number of bills created at once, defaults to the
+            `mjb_purchase_downpayment.bill_chunk_size` system parameter
+        :param bool use_savepoint: if True, a group of orders whose bill cannot be created
+            is rolled back alone and reported, instead of aborting the whole run
+        :returns: the created bills, and the error message per order id of the failed groups
+        :rtype: tuple(`account.move` recordset, dict)
+        """
+        moves = self.env['account.move']
+        failures = {}
+        if not self._check_bill_creation_access():
+            return moves, failures
+        chunk_size = chunk_size or int(self.env['ir.config_parameter'].sudo().get_param(
+            'mjb_purchase_downpayment.bill_chunk_size', 100))
+        # One run for all the chunks, each chunk adds its own phases
+        profiler = self.env['purchase.billing.stat']._profiler('create_invoices', len(self))
+
+        chunk = []
+        for orders, bill_vals_list in self._iter_bill_vals(grouped=grouped, final=final):
+            chunk.append((orders, bill_vals_list))
+            if sum(len(vals_list) for _orders, vals_list in chunk) >= chunk_size:
+                moves |= self._create_bill_chunk(chunk, final, use_savepoint, failures, profiler)
+                chunk = []
+        if chunk:
+            moves |= self._create_bill_chunk(chunk, final, use_savepoint, failures, profiler)
+        profiler.save()
+        return moves, failures
+
+    def _iter_bill_vals(self, grouped=False, final=False):
+        """ Generate the bill values of `self`, one group of orders at a time.
+
+        Only the grouping key of each order is kept in memory up front; the line values
+        of a group are prepared when the group is generated.
+
+        :return: a generator of (orders, bill values list) tuples
+        """
+        if grouped:
+            order_ids_per_key = {order.id: [order.id] for order in self}
+        else:
+            order_ids_per_key = defaultdict(list)
+            for order in self:
+                order = order.with_company(order.company_id)
+                order_ids_per_key[order._get_bill_grouping_key(order._prepare_invoice())].append(order.id)
+            self.env.invalidate_all()
+
+        for order_ids in order_ids_per_key.values():
+            orders = self.browse(order_ids)
+            bill_vals_list = orders._prepare_bill_vals_list(final)
+            if not grouped:
+                bill_vals_list = orders._group_bill_vals(bill_vals_list)
+            if len(bill_vals_list) < len(orders):
+                orders._resequence_bill_vals(bill_vals_list)
+            yield orders, bill_vals_list
+
+    def _create_bill_chunk(self, chunk, final, use_savepoint, failures, profiler):
+        """ Create the bills of a chunk of groups generated by :meth:`_iter_bill_vals`.
+
+        :param list chunk: (orders, bill values list) tuples
+        :param dict failures: updated with the error message per order id of the failed groups
+        :param profiler: `BillingProfiler` of the run
+        :return: the created bills
+        """
+        orders = self.browse([order_id for group_orders, _vals_list in chunk for order_id in group_orders.ids])
+        bill_vals_list = [bill_vals for _orders, vals_list in chunk for bill_vals in vals_list]
+        if not use_savepoint:
+            moves = orders._create_bill_moves(bill_vals_list, final, profiler)
+        else:
+            try:
+                with self.env.cr.savepoint():
+                    moves = orders._create_bill_moves(bill_vals_list, final, profiler)
+            except Exception as e:
+                self.env.invalidate_all(flush=False)
+                if len(chunk) == 1:
+                    group_orders = chunk[0][0]
+                    _logger.warning("Bill creation failed for %s", ', '.join(group_orders.mapped('name')), exc_info=True)
+                    failures.update(dict.fromkeys(group_orders.ids, str(e)))
+                    return self.env['account.move']
+                # Find the failing group(s) by creating the bills group per group
+                moves = self.env['account.move']
+                for group in chunk:
+                    moves |= self._create_bill_chunk([group], final, use_savepoint, failures, profiler)
+                return moves
+        self.env.flush_all()
+        self.env.invalidate_all()
+        return moves
+
+    def _create_bill_moves(self, bill_vals_list, final, profiler):
+        """ Create the bills of the orders `self` from `bill_vals_list` and finalize them. """
+        with profiler.phase('move_create') as phase:
+            moves = self.env['account.move'].sudo().with_context(default_move_type='in_invoice').create(bill_vals_list)
+            phase['rows'] = len(moves)
+        self._post_process_bills(moves, final, profiler)
+        return moves
+
+    def _check_bill_creation_access(self):
         if not self.env['account.move'].check_access_rights('create', False):
             try:
                 self.check_access_rights('write')
                 self.check_access_rule('write')
             except AccessError:
-                return self.env['account.move']
+                return False
+        return True
 
-        # 1) Create invoices.
+    def _prepare_bill_vals_list(self, final=False, invoiceable_lines_per_order=None):
+        """ Prepare the bill values of each order of `self` having lines to bill.
+
+        :param bool final: see :meth:`_create_invoices`
+        :param dict invoiceable_lines_per_order: the lines to bill of each order, as returned
+            by :meth:`_get_invoiceable_lines_per_order`, computed when not given
+        :return: `account.move` creation values, one per order
+        :rtype: list
+        """
         bill_vals_list = []
         invoice_item_sequence = 0 # Incremental sequencing to keep the lines order on the bill.
+        if invoiceable_lines_per_order is None:
+            invoiceable_lines_per_order = self._get_invoiceable_lines_per_order(final)
         for order in self:
             order = order.with_company(order.company_id).with_context(lang=order.partner_id.lang)
 
             invoice_vals = order._prepare_invoice()
-            invoiceable_lines = order._get_invoiceable_lines(final)
+            invoiceable_lines = invoiceable_lines_per_order[order.id].with_env(order.env)
 
             if not any(not line.display_type for line in invoiceable_lines):
                 continue
@@ -187,43 +643,9 @@ Reason(s) of this behavior could be:
 
             invoice_vals['invoice_line_ids'] += invoice_line_vals
             bill_vals_list.append(invoice_vals)
+        return bill_vals_list
 
-        if not bill_vals_list and self._context.get('raise_if_nothing_to_invoice', True):
-            raise UserError(self._nothing_to_invoice_error_message())
-
-        # 2) Manage 'grouped' parameter: group by (partner_id, currency_id).
-        if not grouped:
-            new_bill_vals_list = []
-            invoice_grouping_keys = self._get_invoice_grouping_keys()
-            bill_vals_list = sorted(
-                bill_vals_list,
-                key=lambda x: [
-                    x.get(grouping_key) for grouping_key in invoice_grouping_keys
-                ]
-            )
-            for _grouping_keys, invoices in groupby(bill_vals_list, key=lambda x: [x.get(grouping_key) for grouping_key in invoice_grouping_keys]):
-                origins = set()
-                payment_refs = set()
-                refs = set()
-                ref_invoice_vals = None
-                for invoice_vals in invoices:
-                    if not ref_invoice_vals:
-                        ref_invoice_vals = invoice_vals
-                    else:
-                        ref_invoice_vals['invoice_line_ids'] += invoice_vals['invoice_line_ids']
-                    origins.add(invoice_vals['invoice_origin'])
-                    payment_refs.add(invoice_vals['payment_reference'])
-                    refs.add(invoice_vals['ref'])
-                ref_invoice_vals.update({
-                    'ref': ', '.join(refs)[:2000],
-                    'invoice_origin': ', '.join(origins),
-                    'payment_reference': len(payment_refs) == 1 and payment_refs.pop() or False,
-                })
-                new_bill_vals_list.append(ref_invoice_vals)
-            bill_vals_list = new_bill_vals_list
-
-        # 3) Create invoices.
-
+    def _resequence_bill_vals(self, bill_vals_list):
         # As part of the bill creation, we make sure the sequence of multiple PO do not interfere
         # in a single bill. Example:
         # PO 1:
@@ -242,83 +664,112 @@ Reason(s) of this behavior could be:
         # Resequencing should be safe, however we resequence only if there are less invoices than
         # orders, meaning a grouping might have been done. This could also mean that only a part
         # of the selected PO are billable, but resequencing in this case shouldn't be an issue.
-        if len(bill_vals_list) < len(self):
-            PurchaseOrderLine = self.env['purchase.order.line']
-            for bill in bill_vals_list:
-                sequence = 1
-                for line in bill['invoice_line_ids']:
-                    line[2]['sequence'] = PurchaseOrderLine._get_invoice_line_sequence(new=sequence, old=line[2]['sequence'])
-                    sequence += 1
-
-        # Manage the creation of invoices in sudo because a salesperson must be able to generate an bill from a
-        # purchase order without "billing" access rights. However, he should not be able to create an bill from scratch.
-        moves = self.env['account.move'].sudo().with_context(default_move_type='in_invoice').create(bill_vals_list)
-
-        # 4) Some moves might actually be refunds: convert them if the total amount is negative
+        PurchaseOrderLine = self.env['purchase.order.line']
+        for bill in bill_vals_list:
+            sequence = 1
+            for line in bill['invoice_line_ids']:
+                line[2]['sequence'] = PurchaseOrderLine._get_invoice_line_sequence(new=sequence, old=line[2]['sequence'])
+                sequence += 1
+
+    def _post_process_bills(self, moves, final=False, profiler=None):
+        """ Finalize the bills `moves` created for the orders `self`.
+
+        :param profiler: optional `BillingProfiler` measuring the phases of the run, saved
+            by the caller; without it, the phases are recorded as a run of their own
+        """
+        own_profiler = profiler is None
+        if own_profiler:
+            profiler = self.env['purchase.billing.stat']._profiler('create_invoices', len(self))
+        # Some moves might actually be refunds: convert them if the total amount is negative
         # We do this after the moves have been created since we need taxes, etc. to know if the total
         # is actually negative or not
         if final:
-            moves.sudo().filtered(lambda m: m.amount_total < 0).action_switch_move_type()
+            with profiler.phase('down_payment_rounding') as phase:
+                moves.sudo().filtered(lambda m: m.amount_total < 0).action_switch_move_type()
+                self._apply_down_payment_rounding(moves)
+                phase['rows'] = len(moves)
+        with profiler.phase('chatter') as phase:
+            moves._message_post_origin_links()
+            phase['rows'] = len(moves)
+        if own_profiler:
+            profiler.save()
+
+    def _get_down_payment_ledger_amounts(self, moves):
+        """ Return the down payments of `self` billed on other moves than `moves`, per down
+        payment line, read from the ledger totals of its active entries.
+
+        The amounts carry the sign of the bill lines, see :meth:`_apply_down_payment_rounding`:
+        a deposit on a vendor bill is negative, its deduction positive.
+
+        :rtype: dict mapping down payment line ids to a float
+        """
+        amounts_per_type = defaultdict(dict)
+        for line, move, entry_type, amount in self.env['purchase.downpayment.ledger'].sudo()._read_group(
+            [
+                ('order_id', 'in', self.ids),
+                ('move_id', 'not in', moves.ids),
+                ('entry_type', 'in', ACTIVE_ENTRY_TYPES),
+                ('is_cancelled', '=', False),
+            ],
+            groupby=['purchase_line_id', 'move_id', 'entry_type'],
+            aggregates=['amount:sum'],
+        ):
+            if line:
+                amounts_per_type[line.id, move.id][entry_type] = amount
+
+        amounts = defaultdict(float)
+        for (line_id, _move_id), move_amounts in amounts_per_type.items():
+            # A deposit is logged when its bill is raised, then again when it is posted
+            deposit = max(move_amounts.get('raised', 0.0), move_amounts.get('posted', 0.0))
+            amounts[line_id] += move_amounts.get('deducted', 0.0) - deposit
+        return amounts
+
+    def _apply_down_payment_rounding(self, moves):
+        """ Report on the final bills `moves` the rounding of the down payments they deduct.
+
+        Downpayment might have been determined by a fixed amount set by the user.
+        This amount is tax included. This can lead to rounding issues.
+        E.g. a user wants a 100€ DP on a product with 21% tax.
+        100 / 1.21 = 82.64, 82.64 * 1,21 = 99.99
+        This is already corrected by adding/removing the missing cents on the DP bill,
+        but must also be accounted for on the final bill.
+        """
+        # Only the orders with a down payment in the ledger can have one to deduct
+        orders = self.filtered(lambda order: order.mjb_down_payment_raised or order.mjb_down_payment_posted)
+        if not orders:
+            return
+        # The down payments billed before are read from the ledger, the amounts of the
+        # final bills from their own lines.
+        ledger_amounts = orders._get_down_payment_ledger_amounts(moves)
+
         for move in moves:
-            if final:
-                # Downpayment might have been determined by a fixed amount set by the user.
-                # This amount is tax included. This can lead to rounding issues.
-                # E.g. a user wants a 100€ DP on a product with 21% tax.
-                # 100 / 1.21 = 82.64, 82.64 * 1,21 = 99.99
-                # This is already corrected by adding/removing the missing cents on the DP bill,
-                # but must also be accounted for on the final bill.
-
-                delta_amount = 0
-                for order_line in self.order_line:
-                    if not order_line.mjb_is_downpayment:
-                        continue
-                    inv_amt = order_amt = 0
-                    for invoice_line in order_line.invoice_lines:
-                        sign = 1 if invoice_line.move_id.is_inbound() else -1
-                        if invoice_line.move_id == move:
-                            inv_amt += invoice_line.price_total * sign
-                        elif invoice_line.move_id.state != 'cancel':  # filter out canceled dp lines
-                            order_amt += invoice_line.price_total * sign
-                    if inv_amt and order_amt:
-                        # if not inv_amt, this order line is not related to current move
-                        # if no order_amt, dp order line was not invoiced
-                        delta_amount += inv_amt + order_amt
-
-                if not move.currency_id.is_zero(delta_amount):
-                    receivable_line = move.line_ids.filtered(
-                        lambda aml: aml.account_id.account_type == 'asset_receivable')[:1]
-                    product_lines = move.line_ids.filtered(
-                        lambda aml: aml.display_type == 'product' and aml.mjb_is_downpayment)
-                    tax_lines = move.line_ids.filtered(
-                        lambda aml: aml.tax_line_id.amount_type not in (False, 'fixed'))
-                    if tax_lines and product_lines and receivable_line:
-                        line_commands = [Command.update(receivable_line.id, {
-                            'amount_currency': receivable_line.amount_currency + delta_amount,
-                        })]
-                        delta_sign = 1 if delta_amount > 0 else -1
-                        for lines, attr, sign in (
-                            (product_lines, 'price_total', -1 if move.is_inbound() else 1),
-                            (tax_lines, 'amount_currency', 1),
-                        ):
-                            remaining = delta_amount
-                            lines_len = len(lines)
-                            for line in lines:
-                                if move.currency_id.compare_amounts(remaining, 0) != delta_sign:
-                                    break
-                                amt = delta_sign * max(
-                                    move.currency_id.rounding,
-                                    abs(move.currency_id.round(remaining / lines_len)),
-                                )
-                                remaining -= amt
-                                line_commands.append(Command.update(line.id, {attr: line[attr] + amt * sign}))
-                        move.line_ids = line_commands
-
-            move.message_post_with_source(
-                'mail.message_origin_link',
-                render_values={'self': move, 'origin': move.line_ids.purchase_line_id.order_id},
-                subtype_xmlid='mail.mt_note',
-            )
-        return moves
+            sign = 1 if move.is_inbound() else -1
+            move_amounts = defaultdict(float)
+            for invoice_line in move.invoice_line_ids:
+                if invoice_line.display_type == 'product' and invoice_line.purchase_line_id.mjb_is_downpayment:
+                    move_amounts[invoice_line.purchase_line_id.id] += invoice_line.price_total * sign
+
+            delta_amount = 0
+            for line_id, inv_amt in move_amounts.items():
+                order_amt = ledger_amounts.get(line_id, 0.0)
+                if inv_amt and order_amt:
+                    # if no order_amt, dp order line was not invoiced
+                    delta_amount += inv_amt + order_amt
+
+            if move.currency_id.is_zero(delta_amount):
+                continue
+            payable_line = move.line_ids.filtered(
+                lambda aml: aml.account_id.account_type == 'liability_payable')[:1]
+            product_lines = move.line_ids.filtered(
+                lambda aml: aml.display_type == 'product' and aml.purchase_line_id.mjb_is_downpayment)
+            tax_lines = move.line_ids.filtered(
+                lambda aml: aml.tax_line_id.amount_type not in (False, 'fixed'))
+            if tax_lines and product_lines and payable_line:
+                # One write per move for all its corrected lines
+                move.line_ids = move._get_rounding_delta_commands(delta_amount, payable_line, [
+                    (product_lines, 'price_total', -1 if move.is_inbound() else 1),
+                    (tax_lines, 'amount_currency', 1),
+                ])
 
 
 class PurchaseOrderLine(models.Model):
@@ -326,34 +777,212 @@ class PurchaseOrderLine(models.Model):
 
     mjb_is_downpayment = fields.Boolean(string='Is Deposit Line')
 
+    # Stored so that only the lines linked to a posted, cancelled, reset or edited
+    # bill are recomputed, and so that list views can search, group and sort on them.
     amount_to_bill = fields.Monetary(
         string="Un-billed Balance",
-        compute='_compute_amount_to_invoice'
+        compute='_compute_amount_to_invoice',
+        store=True,
     )
 
     amount_billed = fields.Monetary(
         string="Billed Amount",
-        compute='_compute_amount_billed'
+        compute='_compute_amount_billed',
+        store=True,
     )
 
-    @api.depends('invoice_lines', 'invoice_lines.price_total', 'invoice_lines.move_id.state')
+    def init(self):
+        super().init()
+        # Down payment lines of given orders, see the down payment report and ledger
+        create_index(
+            self.env.cr,
+            'purchase_order_line_mjb_downpayment_order_id_index',
+            self._table,
+            ['order_id'],
+            where='mjb_is_downpayment',
+        )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        lines._get_down_payment_base_lines().order_id._bump_line_version()
+        return lines
+
+    def write(self, vals):
+        if not DOWN_PAYMENT_BASE_LINE_FIELDS.intersection(vals):
+            return super().write(vals)
+        orders = self._get_down_payment_base_lines().order_id
+        res = super().write(vals)
+        (orders | self._get_down_payment_base_lines().order_id)._bump_line_version()
+        return res
+
+    def unlink(self):
+        self._get_down_payment_base_lines().order_id._bump_line_version()
+        return super().unlink()
+
+    def copy_data(self, default=None):
+        # copy_data takes a single record, the lines are copied one by one from the
+        # prefetch of the whole recordset.
+        if len(self) <= 1:
+            return super().copy_data(default)
+        return [vals for line in self for vals in super(PurchaseOrderLine, line).copy_data(default)]
+
+    def _get_down_payment_base_lines(self):
+        """ Return the lines of `self` on which down payments are computed. """
+        return self.filtered(lambda line: not line.display_type and not line.mjb_is_downpayment)
+
+    @api.depends(
+        'invoice_lines', 'invoice_lines.price_total', 'invoice_lines.currency_id',
+        'invoice_lines.move_id.state', 'invoice_lines.move_id.move_type', 'invoice_lines.move_id.invoice_date',
+    )
     def _compute_amount_billed(self):
+        # Records in the database are aggregated in SQL, only new (onchange) records
+        # are computed from the ORM cache.
+        stored_lines = self.filtered('id')
+        amounts = stored_lines._get_amount_billed_sql()
+        amounts.update((self - stored_lines)._get_amount_billed_orm())
         for line in self:
+            line.amount_billed = amounts.get(line.id, 0.0)
+
+    def _get_amount_billed_orm(self):
+        """ Return the billed amount of each line of `self`, computed from the ORM.
+
+        :rtype: dict mapping line ids to the signed billed amount, in the line currency
+        """
+        return self._sum_amount_billed({line: line._get_invoice_lines() for line in self})
+
+    def _get_amount_billed_sql(self):
+        """ Return the billed amount of each line of `self`, aggregated in one grouped query.
+
+        Bill lines in the currency of their purchase line are summed by the database.
+        Only the bill lines in another currency are read back to be converted through
+        :meth:`_sum_amount_billed`, so the bills themselves are never loaded in the cache.
+
+        :rtype: dict mapping line ids to the signed billed amount, in the line currency
+        """
+        if not self:
+            return {}
+        self.env['account.move.line'].flush_model(['move_id', 'purchase_line_id', 'price_total', 'currency_id'])
+        self.env['account.move'].flush_model(['state', 'move_type', 'invoice_date'])
+        self.flush_recordset(['currency_id'])
+
+        params = {'line_ids': self.ids}
+        accrual_condition = ''
+        if self._context.get('accrual_entry_date'):
+            # Same filter as _get_invoice_lines
+            accrual_condition = 'AND am.invoice_date <= %(accrual_entry_date)s'
+            params['accrual_entry_date'] = self._context['accrual_entry_date']
+        self.env.cr.execute("""
+            SELECT aml.purchase_line_id,
+                   SUM(CASE WHEN am.move_type = 'in_refund' THEN -aml.price_total ELSE aml.price_total END)
+                       FILTER (WHERE aml.currency_id = pol.currency_id),
+                   ARRAY_AGG(aml.id) FILTER (WHERE aml.currency_id != pol.currency_id)
+              FROM account_move_line aml
+              JOIN account_move am ON am.id = aml.move_id
+              JOIN purchase_order_line pol ON pol.id = aml.purchase_line_id
+             WHERE aml.purchase_line_id = ANY(%(line_ids)s)
+               AND am.state = 'posted'
+               AND am.move_type IN ('in_invoice', 'in_refund')
+               {accrual_condition}
+          GROUP BY aml.purchase_line_id
+        """.format(accrual_condition=accrual_condition), params)
+
+        amounts = {}
+        foreign_invoice_lines = {}
+        for line_id, amount, foreign_invoice_line_ids in self.env.cr.fetchall():
+            amounts[line_id] = amount or 0.0
+            if foreign_invoice_line_ids:
+                foreign_invoice_lines[self.browse(line_id)] = self.env['account.move.line'].browse(foreign_invoice_line_ids)
+        for line_id, amount in self._sum_amount_billed(foreign_invoice_lines).items():
+            amounts[line_id] += amount
+        return amounts
+
+    @api.model
+    def _sum_amount_billed(self, invoice_lines_by_line):
+        """ Sum the posted bill lines of each purchase line, converted to its currency.
+
+        :param dict invoice_lines_by_line: `account.move.line` recordset per purchase line
+        :rtype: dict mapping line ids to the signed billed amount, in the line currency
+        """
+        rates = self._get_amount_billed_rates(invoice_lines_by_line)
+        amounts = {}
+        for line, invoice_lines in invoice_lines_by_line.items():
             amount_billed = 0.0
-            for invoice_line in line._get_invoice_lines():
+            for invoice_line in invoice_lines:
                 bill = invoice_line.move_id
                 if bill.state == 'posted':
                     bill_date = bill.invoice_date or fields.Date.context_today(self)
                     # Convert the price_total to the currency of the purchase order line
-                    amount_billed_unsigned = invoice_line.currency_id._convert(
-                        invoice_line.price_total, line.currency_id, line.company_id, bill_date
-                    )
+                    amount_billed_unsigned = invoice_line.price_total
+                    if invoice_line.currency_id != line.currency_id:
+                        amount_billed_unsigned *= rates[
+                            invoice_line.currency_id.id, line.currency_id.id, line.company_id.id, bill_date
+                        ]
+                    amount_billed_unsigned = line.currency_id.round(amount_billed_unsigned)
                     # Handle direction sign for vendor bills and refunds
                     if bill.move_type == 'in_invoice':
                         amount_billed += amount_billed_unsigned
                     elif bill.move_type == 'in_refund':
                         amount_billed -= amount_billed_unsigned
-            line.amount_billed = amount_billed
+            amounts[line.id] = amount_billed
+        return amounts
+
+    @api.model
+    def _get_amount_billed_rates(self, invoice_lines_by_line):
+        """ Fetch, in a single query, every conversion rate needed to express the posted
+        bill lines in the currency of their purchase line.
+
+        :param dict invoice_lines_by_line: `account.move.line` recordset per purchase line
+        :return: the conversion rates, as used by :meth:`res.currency._convert`
+        :rtype: dict mapping (from_currency_id, to_currency_id, company_id, date) to a float
+        """
+        conversions = set()
+        for line, invoice_lines in invoice_lines_by_line.items():
+            for invoice_line in invoice_lines:
+                bill = invoice_line.move_id
+                if bill.state != 'posted' or invoice_line.currency_id == line.currency_id:
+                    continue
+                bill_date = bill.invoice_date or fields.Date.context_today(self)
+                conversions.add((invoice_line.currency_id.id, line.currency_id.id, line.company_id.id, bill_date))
+        if not conversions:
+            return {}
+
+        # Rates are looked up the same way as res.currency._get_rates: the most recent
+        # rate of the company (or shared) at the given date, else its earliest rate, 1.0
+        # when there is none.
+        companies = self.env['res.company'].browse({company_id for _f, _t, company_id, _d in conversions})
+        root_company_ids = {company.id: company.root_id.id for company in companies}
+        rate_keys = sorted({
+            (currency_id, root_company_ids[company_id], date)
+            for from_currency_id, to_currency_id, company_id, date in conversions
+            for currency_id in (from_currency_id, to_currency_id)
+        })
+        self.env['res.currency.rate'].flush_model(['rate', 'currency_id', 'company_id', 'name'])
+        self.env.cr.execute("""
+            SELECT req.currency_id, req.company_id, req.date,
+                   COALESCE((SELECT r.rate FROM res_currency_rate r
+                              WHERE r.currency_id = req.currency_id
+                                AND r.name <= req.date
+                                AND (r.company_id IS NULL OR r.company_id = req.company_id)
+                           ORDER BY r.company_id, r.name DESC
+                              LIMIT 1),
+                            (SELECT r.rate FROM res_currency_rate r
+                              WHERE r.currency_id = req.currency_id
+                                AND (r.company_id IS NULL OR r.company_id = req.company_id)
+                           ORDER BY r.company_id, r.name ASC
+                              LIMIT 1),
+                            1.0) AS rate
+              FROM (VALUES %s) AS req(currency_id, company_id, date)
+        """ % ', '.join(['(%s, %s, %s::date)'] * len(rate_keys)),
+            [value for rate_key in rate_keys for value in rate_key],
+        )
+        currency_rates = {(currency_id, company_id, date): rate for currency_id, company_id, date, rate in self.env.cr.fetchall()}
+        return {
+            (from_currency_id, to_currency_id, company_id, date):
+                currency_rates[to_currency_id, root_company_ids[company_id], date]
+                / currency_rates[from_currency_id, root_company_ids[company_id], date]
+            for from_currency_id, to_currency_id, company_id, date in conversions
+        }
 
     @api.depends('price_total', 'amount_billed')
     def _compute_amount_to_invoice(self):
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import logging
+import threading
+
+from odoo import _, api, fields, models
+from odoo.fields import Command
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 50
+
+
+class PurchaseBillingJob(models.Model):
+    _name = 'purchase.billing.job'
+    _description = "Purchase Bill Generation Job"
+    _order = 'id desc'
+
+    name = fields.Char(string="Reference", required=True, readonly=True, default=lambda self: _('New'))
+    state = fields.Selection(
+        selection=[
+            ('queued', "Queued"),
+            ('running', "In Progress"),
+            ('done', "Done"),
+            ('error', "Done with Errors"),
+        ],
+        string="Status",
+        default='queued',
+        required=True,
+        readonly=True,
+    )
+    user_id = fields.Many2one(
+        comodel_name='res.users', string="Requested by", required=True, readonly=True,
+        default=lambda self: self.env.user)
+    company_id = fields.Many2one(
+        comodel_name='res.company', required=True, readonly=True,
+        default=lambda self: self.env.company)
+    chunk_size = fields.Integer(
+        string="Orders per Chunk", required=True,
+        default=lambda self: int(self.env['ir.config_parameter'].sudo().get_param(
+            'mjb_purchase_downpayment.billing_job_chunk_size', DEFAULT_CHUNK_SIZE)),
+        help="Number of purchase orders billed, then committed, at once.")
+
+    # Wizard parameters, the wizard itself being a transient record
+    advance_payment_method = fields.Selection(
+        selection=[
+            ('delivered', "Regular Bill"),
+            ('percentage', "Down payment (percentage)"),
+            ('fixed', "Down payment (fixed amount)"),
+        ],
+        string="Create Bill", required=True, readonly=True)
+    deduct_down_payments = fields.Boolean(string="Deduct down payments", readonly=True)
+    consolidated_billing = fields.Boolean(string="Consolidated Billing", readonly=True)
+    product_id = fields.Many2one(comodel_name='product.product', string="Down Payment Product", readonly=True)
+    amount = fields.Float(string="Down Payment Amount", readonly=True)
+    fixed_amount = fields.Monetary(string="Down Payment Amount (Fixed)", readonly=True)
+    currency_id = fields.Many2one(comodel_name='res.currency', readonly=True)
+
+    line_ids = fields.One2many('purchase.billing.job.line', 'job_id', string="Orders", readonly=True)
+    order_count = fields.Integer(string="Orders", compute='_compute_progress', store=True)
+    processed_count = fields.Integer(string="Processed", compute='_compute_progress', store=True)
+    failed_count = fields.Integer(string="Failed", compute='_compute_progress', store=True)
+    progress = fields.Float(string="Progress", compute='_compute_progress', store=True)
+    bill_count = fields.Integer(string="Bill Count", compute='_compute_bill_count')
+
+    #=== COMPUTE METHODS ===#
+
+    @api.depends('line_ids.state')
+    def _compute_progress(self):
+        for job in self:
+            states = job.line_ids.mapped('state')
+            job.order_count = len(states)
+            job.processed_count = len(states) - states.count('pending')
+            job.failed_count = states.count('failed')
+            job.progress = job.order_count and 100.0 * job.processed_count / job.order_count
+
+    def _compute_bill_count(self):
+        for job in self:
+            job.bill_count = len(job.line_ids.move_ids)
+
+    #=== CRUD METHODS ===#
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        jobs = super().create(vals_list)
+        for job in jobs:
+            if job.name == _('New'):
+                job.name = _("Bill Generation #%s", job.id)
+        return jobs
+
+    #=== ACTION METHODS ===#
+
+    def action_view_bills(self):
+        self.ensure_one()
+        return {
+            'name': _('Bills'),
+            'type': 'ir.actions.act_window',
+            'view_mode': 'tree,form',
+            'res_model': 'account.move',
+            'domain': [('id', 'in', self.line_ids.move_ids.ids)],
+        }
+
+    def action_retry_failed(self):
+        self.line_ids.filtered(lambda line: line.state == 'failed').write({'state': 'pending', 'error': False})
+        self.filtered(lambda job: job.state == 'error').state = 'queued'
+        self._trigger_processing()
+
+    #=== BUSINESS METHODS ===#
+
+    def _trigger_processing(self):
+        self.env.ref('mjb_purchase_downpayment.ir_cron_purchase_billing_job')._trigger()
+
+    @api.model
+    def _cron_process_jobs(self):
+        # Jobs left 'running' by a worker restart are resumed from their pending orders.
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        for job in self.search([('state', 'in', ('queued', 'running'))], order='id'):
+            job._process(auto_commit=auto_commit)
+
+    def _process(self, auto_commit=True):
+        """ Bill the pending orders of the job, one chunk at a time.
+
+        Each chunk is committed on its own, so that a job interrupted by a worker restart
+        resumes from its first pending order. When a chunk fails, its orders are billed
+        one by one to record which ones are failing.
+        """
+        self.ensure_one()
+        self.state = 'running'
+        if auto_commit:
+            self.env.cr.commit()
+        JobLine = self.env['purchase.billing.job.line']
+        while True:
+            lines = JobLine.search([('job_id', '=', self.id), ('state', '=', 'pending')], limit=self.chunk_size)
+            if not lines:
+                break
+            self._process_lines(lines)
+            if auto_commit:
+                self.env.cr.commit()
+        self.state = 'error' if self.failed_count else 'done'
+        if auto_commit:
+            self.env.cr.commit()
+
+    def _process_lines(self, lines):
+        self.ensure_one()
+        try:
+            with self.env.cr.savepoint():
+                bills = self._create_bills(lines.order_id)
+        except Exception as e:
+            self.env.invalidate_all(flush=False)
+            if len(lines) > 1:
+                _logger.info("Bill generation job %s: chunk failed, billing its orders one by one", self.name)
+                for line in lines:
+                    self._process_lines(line)
+            else:
+                _logger.warning("Bill generation job %s: %s failed", self.name, lines.order_id.name, exc_info=True)
+                lines.write({'state': 'failed', 'error': str(e)})
+            return
+        for line in lines:
+            line.write({
+                'state': 'done',
+                'move_ids': [Command.set(bills.filtered(
+                    lambda bill: line.order_id in bill.line_ids.purchase_line_id.order_id
+                ).ids)],
+            })
+
+    def _create_bills(self, purchase_orders):
+        self.ensure_one()
+        wizard_values = {
+            'purchase_order_ids': [Command.set(purchase_orders.ids)],
+            'advance_payment_method': self.advance_payment_method,
+            'deduct_down_payments': self.deduct_down_payments,
+            'consolidated_billing': self.consolidated_billing,
+            'amount': self.amount,
+            'fixed_amount': self.fixed_amount,
+        }
+        if self.product_id:
+            wizard_values['product_id'] = self.product_id.id
+        wizard = self.env['purchase.advance.payment.inv']\
+            .with_user(self.user_id)\
+            .with_company(self.company_id)\
+            .with_context(active_model='purchase.order', active_ids=purchase_orders.ids)\
+            .create(wizard_values)
+        return wizard._create_invoices(wizard.purchase_order_ids)
+
+
+class PurchaseBillingJobLine(models.Model):
+    _name = 'purchase.billing.job.line'
+    _description = "Purchase Bill Generation Job Order"
+    _order = 'job_id, id'
+
+    job_id = fields.Many2one('purchase.billing.job', required=True, ondelete='cascade', index=True)
+    order_id = fields.Many2one('purchase.order', string="Purchase Order", required=True, ondelete='cascade')
+    partner_id = fields.Many2one(related='order_id.partner_id')
+    state = fields.Selection(
+        selection=[
+            ('pending', "Pending"),
+            ('done', "Done"),
+            ('failed', "Failed"),
+        ],
+        string="Status",
+        default='pending',
+        required=True,
+        index=True,
+    )
+    error = fields.Text(string="Error")
+    move_ids = fields.Many2many('account.move', string="Bills", copy=False)
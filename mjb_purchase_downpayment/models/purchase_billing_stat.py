@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import time
+import uuid
+from contextlib import contextmanager
+
+from odoo import api, fields, models
+from odoo.tools import str2bool
+
+PROFILING_PARAM = 'mjb_purchase_downpayment.billing_profiling'
+
+
+class BillingProfiler:
+    """ Measure the phases of one bill generation run, see `purchase.billing.stat`.
+
+    When profiling is disabled, the phases are run without being measured and
+    nothing is saved.
+    """
+
+    def __init__(self, env, flow, order_count, enabled):
+        self.env = env
+        self.flow = flow
+        self.order_count = order_count
+        self.enabled = enabled
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        """ Measure the wall time and queries of the enclosed block. The yielded dict
+        receives the number of rows processed by the phase, under the key `rows`.
+        """
+        stats = {'rows': 0}
+        if not self.enabled:
+            yield stats
+            return
+        cr = self.env.cr
+        queries_before = cr.sql_log_count
+        start = time.perf_counter()
+        yield stats
+        self.phases.append({
+            'phase': name,
+            'duration': time.perf_counter() - start,
+            'query_count': cr.sql_log_count - queries_before,
+            'row_count': stats['rows'],
+        })
+
+    def save(self):
+        """ Record the measured phases, one `purchase.billing.stat` per phase. """
+        if not self.phases:
+            return self.env['purchase.billing.stat']
+        run = uuid.uuid4().hex
+        return self.env['purchase.billing.stat'].sudo().create([{
+            'run': run,
+            'flow': self.flow,
+            'sequence': sequence,
+            'order_count': self.order_count,
+            **phase_values,
+        } for sequence, phase_values in enumerate(self.phases)])
+
+
+class PurchaseBillingStat(models.Model):
+    _name = 'purchase.billing.stat'
+    _description = "Purchase Bill Generation Statistics"
+    _order = 'id desc'
+
+    run = fields.Char(string="Run", required=True, readonly=True, index=True)
+    flow = fields.Selection(
+        selection=[
+            ('create_invoices', "Bills"),
+            ('down_payment', "Down Payments"),
+        ],
+        string="Flow", required=True, readonly=True)
+    phase = fields.Char(string="Phase", required=True, readonly=True)
+    sequence = fields.Integer(readonly=True)
+    user_id = fields.Many2one(
+        comodel_name='res.users', string="User", readonly=True,
+        default=lambda self: self.env.user)
+    company_id = fields.Many2one(
+        comodel_name='res.company', readonly=True,
+        default=lambda self: self.env.company)
+    order_count = fields.Integer(string="Orders", readonly=True)
+    duration = fields.Float(string="Duration (s)", readonly=True, digits=(16, 4))
+    query_count = fields.Integer(string="Queries", readonly=True)
+    row_count = fields.Integer(string="Rows", readonly=True)
+
+    @api.model
+    def _profiler(self, flow, order_count):
+        """ Return a :class:`BillingProfiler` for a run of `flow` on `order_count` orders,
+        enabled by the `mjb_purchase_downpayment.billing_profiling` system parameter.
+        """
+        enabled = str2bool(self.env['ir.config_parameter'].sudo().get_param(PROFILING_PARAM, 'False'), False)
+        return BillingProfiler(self.env, flow, order_count, enabled)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo import api, fields, models
+
+# Ledger entries counted in the totals of the purchase orders
+ACTIVE_ENTRY_TYPES = ('raised', 'posted', 'deducted')
+
+
+class PurchaseDownpaymentLedger(models.Model):
+    _name = 'purchase.downpayment.ledger'
+    _description = "Purchase Down Payment Ledger"
+    _order = 'id desc'
+
+    order_id = fields.Many2one(
+        comodel_name='purchase.order', string="Purchase Order",
+        required=True, readonly=True, index=True, ondelete='cascade')
+    company_id = fields.Many2one(related='order_id.company_id', store=True)
+    partner_id = fields.Many2one(related='order_id.partner_id', store=True)
+    move_id = fields.Many2one(
+        comodel_name='account.move', string="Bill", readonly=True, index='btree_not_null', ondelete='set null')
+    purchase_line_id = fields.Many2one(
+        comodel_name='purchase.order.line', string="Down Payment Line", readonly=True, ondelete='set null')
+    entry_type = fields.Selection(
+        selection=[
+            ('raised', "Raised"),
+            ('posted', "Posted"),
+            ('deducted', "Deducted"),
+            ('cancelled', "Cancelled"),
+        ],
+        string="Type", required=True, readonly=True)
+    date = fields.Date(required=True, readonly=True, default=fields.Date.context_today)
+    currency_id = fields.Many2one(comodel_name='res.currency', required=True, readonly=True)
+    amount = fields.Monetary(
+        string="Amount", readonly=True,
+        help="Amount of the down payment, taxes included. Cancellations carry the amount they cancel.")
+    is_cancelled = fields.Boolean(
+        string="Cancelled", readonly=True,
+        help="Set when the bill of the entry is cancelled or reset to draft, "
+             "the entry no longer counts in the order totals.")
+    cancelled_entry_id = fields.Many2one(
+        comodel_name='purchase.downpayment.ledger', string="Cancelled Entry", readonly=True)
+
+    #=== BUSINESS METHODS ===#
+
+    @api.model
+    def _get_down_payment_lines_amounts(self, moves):
+        """ Return the down payment product lines of `moves` with their signed amount: positive
+        for a deposit, negative for a deduction.
+
+        :rtype: list of (`account.move.line`, float) pairs
+        """
+        lines_amounts = []
+        for move in moves:
+            direction = -1 if move.move_type == 'in_refund' else 1
+            for line in move.invoice_line_ids:
+                if line.display_type == 'product' and line.purchase_line_id.mjb_is_downpayment:
+                    lines_amounts.append((line, line.price_total * direction))
+        return lines_amounts
+
+    @api.model
+    def _prepare_entry_values(self, line, entry_type, amount):
+        return {
+            'order_id': line.purchase_line_id.order_id.id,
+            'move_id': line.move_id.id,
+            'purchase_line_id': line.purchase_line_id.id,
+            'entry_type': entry_type,
+            'date': line.move_id.invoice_date or fields.Date.context_today(self),
+            'currency_id': line.currency_id.id,
+            'amount': amount,
+        }
+
+    @api.model
+    def _log_raised(self, moves):
+        """ Record the deposits billed, in draft, by `moves`. """
+        return self.sudo().create([
+            self._prepare_entry_values(line, 'raised', amount)
+            for line, amount in self._get_down_payment_lines_amounts(moves)
+            if amount > 0
+        ])
+
+    @api.model
+    def _log_posted(self, moves):
+        """ Record the deposits posted, and the deposits deducted, by the posted `moves`. """
+        return self.sudo().create([
+            self._prepare_entry_values(line, 'posted' if amount > 0 else 'deducted', abs(amount))
+            for line, amount in self._get_down_payment_lines_amounts(moves.filtered(lambda m: m.state == 'posted'))
+        ])
+
+    @api.model
+    def _log_cancelled(self, moves, entry_types=ACTIVE_ENTRY_TYPES):
+        """ Cancel the entries of `moves` of the given types, recording one `cancelled` entry
+        for each of them.
+        """
+        entries = self.sudo().search([
+            ('move_id', 'in', moves.ids),
+            ('entry_type', 'in', entry_types),
+            ('is_cancelled', '=', False),
+        ])
+        if not entries:
+            return entries
+        entries.is_cancelled = True
+        return self.sudo().create([{
+            'order_id': entry.order_id.id,
+            'move_id': entry.move_id.id,
+            'purchase_line_id': entry.purchase_line_id.id,
+            'entry_type': 'cancelled',
+            'currency_id': entry.currency_id.id,
+            'amount': entry.amount,
+            'cancelled_entry_id': entry.id,
+        } for entry in entries])
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import logging
+import threading
+from collections import defaultdict
+
+from odoo import _, api, fields, models
+from odoo.exceptions import UserError, ValidationError
+from odoo.fields import Command
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 50
+
+
+class PurchaseDownpaymentMilestone(models.Model):
+    _name = 'purchase.downpayment.milestone'
+    _description = "Purchase Down Payment Milestone"
+    _order = 'order_id, sequence, id'
+
+    order_id = fields.Many2one(
+        comodel_name='purchase.order', string="Purchase Order",
+        required=True, index=True, ondelete='cascade')
+    company_id = fields.Many2one(related='order_id.company_id', store=True)
+    currency_id = fields.Many2one(related='order_id.currency_id')
+    sequence = fields.Integer(default=10)
+    name = fields.Char(string="Description", required=True)
+    trigger = fields.Selection(
+        selection=[
+            ('confirmation', "At Confirmation"),
+            ('date', "On Date"),
+            ('receipt', "On Receipt"),
+        ],
+        string="Due", required=True, default='confirmation')
+    date = fields.Date(string="Due Date")
+    advance_payment_method = fields.Selection(
+        selection=[
+            ('percentage', "Percentage"),
+            ('fixed', "Fixed Amount"),
+        ],
+        string="Down Payment", required=True, default='percentage')
+    amount = fields.Float(string="Percentage")
+    fixed_amount = fields.Monetary(string="Fixed Amount")
+    state = fields.Selection(
+        selection=[
+            ('pending', "Pending"),
+            ('raised', "Raised"),
+        ],
+        string="Status", required=True, default='pending', readonly=True, copy=False)
+    move_id = fields.Many2one(comodel_name='account.move', string="Bill", readonly=True, copy=False)
+
+    #=== CONSTRAINT METHODS ===#
+
+    @api.constrains('trigger', 'date', 'advance_payment_method', 'amount', 'fixed_amount')
+    def _check_milestone(self):
+        for milestone in self:
+            if milestone.trigger == 'date' and not milestone.date:
+                raise ValidationError(_("The milestone %s is due on a date, please set it.", milestone.name))
+            if milestone.advance_payment_method == 'percentage' and not 0 < milestone.amount <= 100:
+                raise ValidationError(_("The percentage of the milestone %s must be between 0 and 100.", milestone.name))
+            if milestone.advance_payment_method == 'fixed' and milestone.fixed_amount <= 0:
+                raise ValidationError(_("The amount of the milestone %s must be positive.", milestone.name))
+
+    @api.ondelete(at_uninstall=False)
+    def _unlink_except_raised(self):
+        raised_milestones = self.filtered(lambda milestone: milestone.state == 'raised')
+        if raised_milestones:
+            raise UserError(_(
+                "You cannot delete the milestones whose down payment has been billed: %s",
+                ", ".join(raised_milestones.mapped('name')),
+            ))
+
+    #=== BUSINESS METHODS ===#
+
+    def _is_due(self, today):
+        self.ensure_one()
+        if self.trigger == 'date':
+            return self.date <= today
+        if self.trigger == 'receipt':
+            return any(line.qty_received for line in self.order_id.order_line)
+        return True
+
+    def _get_raise_key(self):
+        """ Return the key of the milestones raised together, with one wizard. """
+        self.ensure_one()
+        if self.advance_payment_method == 'percentage':
+            return self.company_id, self.advance_payment_method, self.amount, False
+        # Fixed amounts are billed in the currency of the orders
+        return self.company_id, self.advance_payment_method, self.fixed_amount, self.currency_id
+
+    @api.model
+    def _cron_raise_due_milestones(self, chunk_size=None):
+        """ Bill the down payments of the due milestones of all confirmed orders.
+
+        The milestones sharing the same company, method and amount are billed together by
+        chunks of orders, through the down payment wizard; each chunk is committed on its own.
+        """
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        chunk_size = chunk_size or int(self.env['ir.config_parameter'].sudo().get_param(
+            'mjb_purchase_downpayment.milestone_chunk_size', DEFAULT_CHUNK_SIZE))
+        today = fields.Date.context_today(self)
+        milestones = self.search([
+            ('state', '=', 'pending'),
+            ('order_id.state', 'in', ('purchase', 'done')),
+        ])
+
+        # An order appears at most once per batch: its next due milestone with the same
+        # key goes to the following batch.
+        batches = defaultdict(lambda: self.env['purchase.downpayment.milestone'])
+        occurrences = defaultdict(int)
+        for milestone in milestones.filtered(lambda m: m._is_due(today)):
+            key = milestone._get_raise_key()
+            occurrence = occurrences[key, milestone.order_id]
+            occurrences[key, milestone.order_id] += 1
+            batches[key, occurrence] |= milestone
+
+        for _key, batch in sorted(batches.items(), key=lambda item: item[0][1]):
+            for index in range(0, len(batch), chunk_size):
+                batch[index:index + chunk_size]._raise()
+                if auto_commit:
+                    self.env.cr.commit()
+
+    def _raise(self):
+        """ Bill the down payments of the milestones `self`, sharing the same
+        :meth:`_get_raise_key`, each on its own order.
+        """
+        orders = self.order_id
+        try:
+            with self.env.cr.savepoint():
+                bills = self._run_down_payment_wizard(orders)
+        except Exception:
+            self.env.invalidate_all(flush=False)
+            _logger.warning("Down payment milestones of the orders %s failed", orders.ids, exc_info=True)
+            return self.env['account.move']
+        for milestone in self:
+            milestone.write({
+                'state': 'raised',
+                'move_id': bills.filtered(
+                    lambda bill: milestone.order_id in bill.line_ids.purchase_line_id.order_id)[:1].id,
+            })
+        return bills
+
+    def _run_down_payment_wizard(self, orders):
+        milestone = self[:1]
+        wizard = self.env['purchase.advance.payment.inv']\
+            .with_company(milestone.company_id)\
+            .with_context(active_model='purchase.order', active_ids=orders.ids)\
+            .create({
+                'purchase_order_ids': [Command.set(orders.ids)],
+                'advance_payment_method': milestone.advance_payment_method,
+                'amount': milestone.amount,
+                'fixed_amount': milestone.fixed_amount,
+                'consolidated_billing': False,
+            })
+        return wizard._create_down_payment_bills(wizard.purchase_order_ids)
@@ -1,6 +1,6 @@
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
-from odoo import _, api, fields, models
+from odoo import _, api, fields, models, tools
 from odoo.exceptions import ValidationError
 
 
@@ -16,4 +16,59 @@ class ResCompany(models.Model):
         ],
         help="Default product used for down payments",
         check_company=True,
-    )
\ No newline at end of file
+    )
+    purchase_bill_grouping_field_ids = fields.Many2many(
+        comodel_name='ir.model.fields',
+        relation='res_company_purchase_bill_grouping_field_rel',
+        string="Bill Grouping Fields",
+        domain=[
+            ('model', '=', 'account.move'),
+            ('store', '=', True),
+            ('ttype', 'in', ('many2one', 'char', 'selection', 'boolean', 'date')),
+        ],
+        help="Fields of the bills, in addition to the company, vendor and currency, "
+             "on which purchase orders are grouped on consolidated bills.",
+    )
+
+    purchase_auto_billing = fields.Boolean(
+        string="Automatic Billing",
+        help="Bill the received quantities of the purchase orders every night.")
+    purchase_auto_billing_consolidated = fields.Boolean(
+        string="Consolidate Automatic Bills", default=True,
+        help="Group the orders of a same vendor and currency on one bill.")
+    purchase_auto_billing_final = fields.Boolean(
+        string="Deduct Down Payments on Automatic Bills", default=True,
+        help="Deduct the down payments of the orders from their automatic bills.")
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'purchase_down_payment_product_id' in vals or 'purchase_bill_grouping_field_ids' in vals:
+            self.env.registry.clear_cache()
+        return res
+
+    @api.model
+    @tools.ormcache('company_id')
+    def _get_purchase_down_payment_config(self, company_id):
+        """ Return the deposit product of the company, with its expense account and supplier taxes.
+
+        The product set in the `mjb_purchase_downpayment.mjb_deposit_product_id` system
+        parameter takes precedence over the one of the company.
+
+        :param int company_id: id of the company
+        :return: ids of the deposit product, its expense account and its supplier taxes
+        :rtype: tuple(int, int, tuple(int))
+        """
+        company = self.browse(company_id)
+        product_id = self.env['ir.config_parameter'].sudo().get_param("mjb_purchase_downpayment.mjb_deposit_product_id", False)
+        if product_id:
+            product = self.env['product.product'].browse(int(product_id))
+        else:
+            product = company.sudo().purchase_down_payment_product_id
+        product = product.sudo().with_company(company)
+        if not product:
+            return False, False, ()
+        return (
+            product.id,
+            product._get_product_accounts()['expense'].id,
+            tuple(product.supplier_taxes_id.ids),
+        )
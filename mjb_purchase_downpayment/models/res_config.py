@@ -11,4 +11,25 @@ class ResConfigSettings(models.TransientModel):
     po_deposit_default_product_id = fields.Many2one(
         related='company_id.purchase_down_payment_product_id',
         readonly=False,
-    )
\ No newline at end of file
+    )
+    po_bill_grouping_field_ids = fields.Many2many(
+        related='company_id.purchase_bill_grouping_field_ids',
+        readonly=False,
+    )
+    po_auto_billing = fields.Boolean(
+        related='company_id.purchase_auto_billing',
+        readonly=False,
+    )
+    po_auto_billing_consolidated = fields.Boolean(
+        related='company_id.purchase_auto_billing_consolidated',
+        readonly=False,
+    )
+    po_auto_billing_final = fields.Boolean(
+        related='company_id.purchase_auto_billing_final',
+        readonly=False,
+    )
+
+    def set_values(self):
+        super().set_values()
+        # The deposit product configuration is cached per company
+        self.env.registry.clear_cache()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo import fields, models, tools
+
+
+class PurchaseDownpaymentReport(models.Model):
+    _name = 'purchase.downpayment.report'
+    _description = "Vendor Deposit Exposure"
+    _auto = False
+    _rec_name = 'order_id'
+    _order = 'date_order desc, id desc'
+
+    order_id = fields.Many2one('purchase.order', string="Purchase Order", readonly=True)
+    partner_id = fields.Many2one('res.partner', string="Vendor", readonly=True)
+    company_id = fields.Many2one('res.company', string="Company", readonly=True)
+    currency_id = fields.Many2one('res.currency', string="Currency", readonly=True)
+    user_id = fields.Many2one('res.users', string="Buyer", readonly=True)
+    date_order = fields.Datetime(string="Order Date", readonly=True)
+    amount_deposited = fields.Monetary(
+        string="Deposited", readonly=True,
+        help="Down payments billed on posted bills, taxes included.")
+    amount_deducted = fields.Monetary(
+        string="Deducted", readonly=True,
+        help="Down payments deducted from posted bills or refunded, taxes included.")
+    amount_outstanding = fields.Monetary(
+        string="Outstanding", readonly=True,
+        help="Down payments billed but not deducted yet, taxes included.")
+
+    def _select(self):
+        return """
+            SELECT pol.id AS id,
+                   po.id AS order_id,
+                   po.partner_id AS partner_id,
+                   po.company_id AS company_id,
+                   po.currency_id AS currency_id,
+                   po.user_id AS user_id,
+                   po.date_order AS date_order,
+                   COALESCE(SUM(bill_line.amount) FILTER (WHERE bill_line.amount > 0), 0) AS amount_deposited,
+                   COALESCE(-SUM(bill_line.amount) FILTER (WHERE bill_line.amount < 0), 0) AS amount_deducted,
+                   COALESCE(SUM(bill_line.amount), 0) AS amount_outstanding
+        """
+
+    def _from(self):
+        return """
+            FROM purchase_order_line pol
+            JOIN purchase_order po ON po.id = pol.order_id
+       LEFT JOIN (
+                SELECT aml.purchase_line_id,
+                       aml.price_total * CASE WHEN am.move_type = 'in_refund' THEN -1 ELSE 1 END AS amount
+                  FROM account_move_line aml
+                  JOIN account_move am ON am.id = aml.move_id
+                 WHERE am.state = 'posted'
+                   AND am.move_type IN ('in_invoice', 'in_refund')
+                   AND aml.display_type = 'product'
+            ) bill_line ON bill_line.purchase_line_id = pol.id
+        """
+
+    def _where(self):
+        return """
+            WHERE pol.mjb_is_downpayment
+              AND pol.display_type IS NULL
+        """
+
+    def _group_by(self):
+        return """
+            GROUP BY pol.id, po.id
+        """
+
+    def init(self):
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        self.env.cr.execute("CREATE OR REPLACE VIEW %s AS (%s %s %s %s)" % (
+            self._table, self._select(), self._from(), self._where(), self._group_by(),
+        ))
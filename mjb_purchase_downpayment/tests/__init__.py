@@ -1 +1,17 @@
 from . import test_js
+from . import test_account_move_unlink
+from . import test_amount_billed
+from . import test_auto_billing
+from . import test_billing_job
+from . import test_billing_stat
+from . import test_chatter
+from . import test_create_invoices
+from . import test_down_payment_wizard
+from . import test_downpayment_ledger
+from . import test_downpayment_milestone
+from . import test_downpayment_report
+from . import test_indexes
+from . import test_invoiceable_lines
+from . import test_purchase_order_copy
+from . import test_rounding_allocation
+from . import test_benchmark
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import time
+from datetime import date, timedelta
+
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+from odoo.fields import Command
+
+
+class MjbPurchaseDownpaymentCommon(AccountTestInvoicingCommon):
+
+    @classmethod
+    def setUpClass(cls, chart_template_ref=None):
+        super().setUpClass(chart_template_ref=chart_template_ref)
+        cls.vendor = cls.partner_a
+        cls.foreign_currency = cls.currency_data['currency']
+        cls.purchase_tax = cls.company_data['default_tax_purchase']
+        cls.product_ordered = cls.env['product.product'].create({
+            'name': 'Ordered service',
+            'type': 'service',
+            'purchase_method': 'purchase',
+            'standard_price': 100.0,
+            'supplier_taxes_id': [Command.set(cls.purchase_tax.ids)],
+        })
+        cls.deposit_product = cls.env['product.product'].create({
+            'name': 'Deposit',
+            'type': 'service',
+            'purchase_method': 'purchase',
+            'supplier_taxes_id': [Command.set(cls.purchase_tax.ids)],
+        })
+        cls.env.company.purchase_down_payment_product_id = cls.deposit_product
+
+    @classmethod
+    def _create_purchase_orders(cls, order_count=1, line_count=1, partner=None, currency=None,
+                                price_unit=100.0, quantity=10.0, confirm=True):
+        orders = cls.env['purchase.order'].create([{
+            'partner_id': (partner or cls.vendor).id,
+            'currency_id': (currency or cls.env.company.currency_id).id,
+            'order_line': [
+                Command.create({
+                    'product_id': cls.product_ordered.id,
+                    'product_qty': quantity,
+                    'price_unit': price_unit,
+                })
+                for _i in range(line_count)
+            ],
+        } for _j in range(order_count)])
+        if confirm:
+            orders.button_confirm()
+        return orders
+
+    @classmethod
+    def _create_partial_bills(cls, orders, bill_count, quantity=1.0, currency=None, move_type='in_invoice', post=True):
+        """ Bill `quantity` of every product line of `orders`, `bill_count` times.
+
+        Each round of bills gets its own bill date so that multi-currency bills need a
+        distinct conversion rate per round.
+        """
+        vals_list = []
+        for bill_index in range(bill_count):
+            for order in orders:
+                bill_vals = order._prepare_invoice()
+                bill_vals.update({
+                    'move_type': move_type,
+                    'invoice_date': date(2017, 1, 1) + timedelta(days=bill_index),
+                    'currency_id': (currency or order.currency_id).id,
+                    'invoice_line_ids': [
+                        Command.create({**line._prepare_account_move_line(), 'quantity': quantity})
+                        for line in order.order_line
+                        if not line.display_type
+                    ],
+                })
+                vals_list.append(bill_vals)
+        bills = cls.env['account.move'].create(vals_list)
+        if post:
+            bills.action_post()
+        return bills
+
+    @classmethod
+    def _create_vendors(cls, count):
+        return cls.env['res.partner'].create([{'name': 'Vendor %s' % index} for index in range(count)])
+
+    @classmethod
+    def _create_down_payments(cls, orders, post=True, **wizard_values):
+        """ Bill a down payment on `orders` through the wizard, one bill per order by default. """
+        wizard = cls.env['purchase.advance.payment.inv']\
+            .with_context(active_model='purchase.order', active_ids=orders.ids)\
+            .create({
+                'advance_payment_method': 'percentage',
+                'amount': 30,
+                'consolidated_billing': False,
+                **wizard_values,
+            })
+        bills = wizard._create_invoices(orders)
+        if post:
+            bills.invoice_date = date(2017, 1, 1)
+            bills.action_post()
+        return bills
+
+    def _measure(self, func, *args, **kwargs):
+        """ Run ``func`` on a cold cache and return its result, query count and wall time. """
+        self.env.flush_all()
+        self.env.invalidate_all()
+        queries_before = self.env.cr.sql_log_count
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.env.flush_all()
+        return result, self.env.cr.sql_log_count - queries_before, time.perf_counter() - start
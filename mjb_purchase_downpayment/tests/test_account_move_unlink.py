@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo.tests import tagged
+
+from .common import MjbPurchaseDownpaymentCommon
+
+
+@tagged('post_install', '-at_install')
+class TestAccountMoveUnlink(MjbPurchaseDownpaymentCommon):
+
+    def _down_payment_lines(self, orders):
+        return orders.order_line.filtered(lambda line: line.mjb_is_downpayment and not line.display_type)
+
+    def test_unlink_mixed_posted_and_draft_bills(self):
+        orders = self._create_purchase_orders(order_count=2)
+        posted_bills = self._create_down_payments(orders)
+        draft_bills = self._create_down_payments(orders, post=False)
+        posted_lines = posted_bills.line_ids.purchase_line_id
+        draft_lines = draft_bills.line_ids.purchase_line_id
+        self.assertEqual(len(self._down_payment_lines(orders)), 4)
+
+        draft_bills.unlink()
+
+        self.assertFalse(draft_lines.exists())
+        self.assertEqual(posted_lines.exists(), posted_lines)
+        self.assertEqual(self._down_payment_lines(orders), posted_lines)
+        # The sections are kept
+        self.assertEqual(len(orders.order_line.filtered('display_type')), 2)
+
+    def test_unlink_draft_final_bill_keeps_posted_down_payment(self):
+        order = self._create_purchase_orders()
+        down_payment_bill = self._create_down_payments(order)
+        down_payment_line = down_payment_bill.line_ids.purchase_line_id
+        final_bill = order._create_invoices(final=True)
+        self.assertIn(down_payment_line, final_bill.line_ids.purchase_line_id)
+
+        final_bill.unlink()
+
+        self.assertTrue(down_payment_line.exists())
+        self.assertEqual(down_payment_line.invoice_lines.move_id, down_payment_bill)
+
+    def test_unlink_draft_bills_of_same_down_payment(self):
+        order = self._create_purchase_orders()
+        down_payment_bill = self._create_down_payments(order, post=False)
+        down_payment_line = down_payment_bill.line_ids.purchase_line_id
+        final_bill = order._create_invoices(final=True)
+
+        down_payment_bill.unlink()
+
+        self.assertFalse(down_payment_line.exists())
+        self.assertFalse(final_bill.line_ids.purchase_line_id.filtered('mjb_is_downpayment'))
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import importlib.util
+from datetime import date
+
+from odoo.tests import tagged
+from odoo.tools import file_path
+
+from .common import MjbPurchaseDownpaymentCommon
+
+
+@tagged('post_install', '-at_install')
+class TestAmountBilled(MjbPurchaseDownpaymentCommon):
+
+    @classmethod
+    def setUpClass(cls, chart_template_ref=None):
+        super().setUpClass(chart_template_ref=chart_template_ref)
+        company_currency = cls.env.company.currency_id
+        cls.orders = (
+            cls._create_purchase_orders(line_count=3)
+            + cls._create_purchase_orders(line_count=2, currency=cls.foreign_currency)
+        )
+        # Posted bills in the order currency and in another currency, a refund,
+        # and bills that must be ignored: a draft one and a cancelled one.
+        cls._create_partial_bills(cls.orders, 2)
+        cls._create_partial_bills(cls.orders, 1, currency=company_currency, quantity=2.0)
+        cls._create_partial_bills(cls.orders[1], 1, currency=company_currency, move_type='in_refund')
+        cls._create_partial_bills(cls.orders, 1, post=False)
+        cls._create_partial_bills(cls.orders, 1).button_cancel()
+        cls.lines = cls.orders.order_line
+
+    def assert_amounts_equal(self, amounts, expected_amounts):
+        self.assertEqual(set(amounts), set(expected_amounts))
+        for line in self.lines:
+            self.assertFalse(
+                line.currency_id.compare_amounts(amounts[line.id], expected_amounts[line.id]),
+                "Billed amount mismatch on %s" % line.order_id.name,
+            )
+
+    def test_sql_matches_orm(self):
+        self.assert_amounts_equal(self.lines._get_amount_billed_sql(), self.lines._get_amount_billed_orm())
+
+    def test_sql_matches_orm_accrual_date(self):
+        lines = self.lines.with_context(accrual_entry_date=date(2017, 1, 1))
+        self.assert_amounts_equal(lines._get_amount_billed_sql(), lines._get_amount_billed_orm())
+
+    def test_stored_amounts(self):
+        expected_amounts = self.lines._get_amount_billed_orm()
+        self.env.invalidate_all()
+        for line in self.lines:
+            self.assertTrue(line.amount_billed)
+            self.assertAlmostEqual(line.amount_billed, expected_amounts[line.id], places=2)
+            self.assertAlmostEqual(line.amount_to_bill, line.price_total - line.amount_billed, places=2)
+        for order in self.orders:
+            self.assertAlmostEqual(order.amount_billed, sum(order.order_line.mapped('amount_billed')), places=2)
+
+    def test_bill_before_first_rate(self):
+        """ Bills dated before the first rate are converted at the earliest rate, as by _convert. """
+        order = self._create_purchase_orders(currency=self.foreign_currency)
+        bill = self._create_partial_bills(order, 1, currency=self.env.company.currency_id, post=False)
+        bill.invoice_date = date(2015, 1, 1)
+        bill.action_post()
+        line = order.order_line
+        expected_amount = bill.invoice_line_ids.price_total
+        expected_amount = bill.currency_id._convert(expected_amount, line.currency_id, line.company_id, bill.invoice_date)
+
+        self.assertAlmostEqual(line._get_amount_billed_sql()[line.id], expected_amount, places=2)
+        self.assertAlmostEqual(line.amount_billed, expected_amount, places=2)
+
+    def _run_migration(self, script):
+        path = file_path('mjb_purchase_downpayment/migrations/17.0.0.4/%s.py' % script)
+        spec = importlib.util.spec_from_file_location('mjb_purchase_downpayment_%s' % script.replace('-', '_'), path)
+        migration = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(migration)
+        migration.migrate(self.env.cr, '17.0.0.3')
+
+    def test_migration_backfills_billed_orders(self):
+        self.env.flush_all()
+        expected_amounts = {
+            order: (order.amount_billed, order.amount_to_bill)
+            for order in self.orders
+        }
+        self.assertTrue(all(amount_billed for amount_billed, _amount_to_bill in expected_amounts.values()))
+
+        # The pre-migration resets the balances as if nothing was billed
+        self._run_migration('pre-migrate')
+        self.env.invalidate_all()
+        self.assertFalse(any(self.orders.mapped('amount_billed')))
+
+        self._run_migration('post-migrate')
+        self.env.invalidate_all()
+        for order, (amount_billed, amount_to_bill) in expected_amounts.items():
+            self.assertAlmostEqual(order.amount_billed, amount_billed, places=2)
+            self.assertAlmostEqual(order.amount_to_bill, amount_to_bill, places=2)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from unittest.mock import patch
+
+from odoo.exceptions import AccessError
+from odoo.tests import tagged
+
+from .common import MjbPurchaseDownpaymentCommon
+
+
+@tagged('post_install', '-at_install')
+class TestAutoBilling(MjbPurchaseDownpaymentCommon):
+
+    @classmethod
+    def setUpClass(cls, chart_template_ref=None):
+        super().setUpClass(chart_template_ref=chart_template_ref)
+        cls.env.company.write({
+            'purchase_auto_billing': True,
+            'purchase_auto_billing_consolidated': True,
+        })
+
+    def test_auto_bill_dirty_orders_only(self):
+        orders = self._create_purchase_orders(order_count=3)
+        self.assertTrue(all(orders.mapped('mjb_billing_dirty')))
+
+        self.env['purchase.order']._cron_auto_bill(batch_size=2)
+
+        self.assertEqual(len(orders.invoice_ids), 2, "Each batch of orders should be billed on its own")
+        self.assertFalse(any(orders.mapped('mjb_billing_dirty')))
+
+        self.env['purchase.order']._cron_auto_bill()
+        self.assertEqual(len(orders.invoice_ids), 2, "Clean orders should not be billed again")
+
+    def test_cancelled_bill_marks_orders_dirty(self):
+        order = self._create_purchase_orders()
+        self.env['purchase.order']._cron_auto_bill()
+        bill = order.invoice_ids
+
+        bill.button_cancel()
+        self.assertTrue(order.mjb_billing_dirty)
+
+        self.env['purchase.order']._cron_auto_bill()
+        self.assertEqual(len(order.invoice_ids.filtered(lambda move: move.state == 'draft')), 1)
+
+    def test_received_quantity_marks_order_dirty(self):
+        order = self._create_purchase_orders()
+        order.mjb_billing_dirty = False
+
+        order.order_line.qty_received = 1.0
+
+        self.assertTrue(order.mjb_billing_dirty)
+
+    def test_failing_batch_stays_dirty(self):
+        orders = self._create_purchase_orders(order_count=2)
+        PurchaseOrder = type(self.env['purchase.order'])
+        create_invoices = PurchaseOrder._create_invoices
+
+        def _create_invoices(self, *args, **kwargs):
+            if orders[0] in self:
+                raise AccessError("Not allowed")
+            return create_invoices(self, *args, **kwargs)
+
+        with patch.object(PurchaseOrder, '_create_invoices', _create_invoices):
+            self.env['purchase.order']._cron_auto_bill(batch_size=1)
+
+        self.assertFalse(orders[0].invoice_ids)
+        self.assertTrue(orders[0].mjb_billing_dirty)
+        self.assertEqual(len(orders[1].invoice_ids), 1, "The other batches should still be billed")
+        self.assertFalse(orders[1].mjb_billing_dirty)
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+""" Query count and wall time benchmarks of the down payment flows.
+
+Run with ``--test-tags /mjb_purchase_downpayment:mjb_benchmark``. Every measure is logged
+as a ``MJB_BENCHMARK <json>`` line and, when the ``MJB_BENCHMARK_OUTPUT`` environment
+variable is set, appended to that file as JSON lines, e.g.::
+
+    {"scenario": "create_invoices", "queries": 412, "seconds": 1.2034, "orders": 50, ...}
+"""
+
+import json
+import logging
+import os
+
+from odoo import fields
+from odoo.tests import tagged
+
+from .common import MjbPurchaseDownpaymentCommon
+
+_logger = logging.getLogger(__name__)
+
+
+class PurchaseDownpaymentBenchmarkCase(MjbPurchaseDownpaymentCommon):
+
+    def _record(self, scenario, queries, duration, **params):
+        result = {
+            'scenario': scenario,
+            'test': '%s.%s' % (type(self).__name__, self._testMethodName),
+            'queries': queries,
+            'seconds': round(duration, 4),
+            **params,
+        }
+        _logger.info("MJB_BENCHMARK %s", json.dumps(result))
+        output = os.environ.get('MJB_BENCHMARK_OUTPUT')
+        if output:
+            with open(output, 'a', encoding='utf-8') as output_file:
+                output_file.write(json.dumps(result) + '\n')
+
+    def _benchmark(self, scenario, func, *args, params=None, **kwargs):
+        """ Measure ``func`` on a cold cache, record the measure and return its result. """
+        result, queries, duration = self._measure(func, *args, **kwargs)
+        self._record(scenario, queries, duration, **(params or {}))
+        return result
+
+
+@tagged('post_install', '-at_install', 'mjb_benchmark', '-standard')
+class TestDownPaymentFlowsBenchmark(PurchaseDownpaymentBenchmarkCase):
+    """ Hot paths of the module on a multi-vendor, multi-currency selection of orders. """
+
+    VENDOR_COUNT = 5
+    ORDERS_PER_VENDOR = 10
+    LINE_COUNT = 20
+    BILL_COUNT = 3
+
+    @classmethod
+    def setUpClass(cls, chart_template_ref=None):
+        super().setUpClass(chart_template_ref=chart_template_ref)
+        cls.orders = cls.env['purchase.order']
+        for vendor in cls._create_vendors(cls.VENDOR_COUNT):
+            for currency in (cls.env.company.currency_id, cls.foreign_currency):
+                cls.orders += cls._create_purchase_orders(
+                    order_count=cls.ORDERS_PER_VENDOR // 2, line_count=cls.LINE_COUNT,
+                    partner=vendor, currency=currency,
+                )
+        cls._create_partial_bills(cls.orders, cls.BILL_COUNT, currency=cls.env.company.currency_id)
+        cls._create_down_payments(cls.orders)
+        cls.params = {
+            'orders': len(cls.orders),
+            'lines_per_order': cls.LINE_COUNT,
+            'bills_per_order': cls.BILL_COUNT,
+        }
+
+    def test_open_wizard(self):
+        def open_wizard(orders):
+            wizard = self.env['purchase.advance.payment.inv']\
+                .with_context(active_model='purchase.order', active_ids=orders.ids)\
+                .create({})
+            return wizard.read([
+                'count', 'has_down_payments', 'product_id', 'amount_billed', 'amount_to_bill',
+                'display_draft_bill_warning', 'display_bill_amount_warning',
+            ])
+
+        self._benchmark('open_wizard', open_wizard, self.orders[:1], params={**self.params, 'orders': 1})
+        self._benchmark('open_wizard', open_wizard, self.orders, params=self.params)
+
+    def test_compute_amount_billed(self):
+        lines = self.orders.order_line
+        self._benchmark('compute_amount_billed', lines._compute_amount_billed, params=self.params)
+        self._benchmark('amount_billed_orm', lines._get_amount_billed_orm, params=self.params)
+
+    def test_get_invoiceable_lines(self):
+        def get_invoiceable_lines():
+            for order in self.orders:
+                order._get_invoiceable_lines(final=True)
+
+        self._benchmark('get_invoiceable_lines', get_invoiceable_lines, params=self.params)
+
+    def _benchmark_create_invoices(self, grouped, final):
+        bills = self._benchmark(
+            'create_invoices', self.orders._create_invoices, grouped=grouped, final=final,
+            params={**self.params, 'grouped': grouped, 'final': final},
+        )
+        self.assertEqual(len(bills), len(self.orders) if grouped else 2 * self.VENDOR_COUNT)
+
+    def test_create_invoices_grouped(self):
+        self._benchmark_create_invoices(grouped=True, final=False)
+
+    def test_create_invoices_grouped_final(self):
+        self._benchmark_create_invoices(grouped=True, final=True)
+
+    def test_create_invoices_consolidated(self):
+        self._benchmark_create_invoices(grouped=False, final=False)
+
+    def test_create_invoices_consolidated_final(self):
+        self._benchmark_create_invoices(grouped=False, final=True)
+
+    def test_create_down_payments(self):
+        self._benchmark(
+            'create_down_payments', self._create_down_payments, self.orders[:1], post=False,
+            params={**self.params, 'orders': 1},
+        )
+        self._benchmark(
+            'create_down_payments', self._create_down_payments, self.orders, post=False,
+            params={**self.params, 'consolidated': False},
+        )
+        self._benchmark(
+            'create_down_payments', self._create_down_payments, self.orders, post=False,
+            consolidated_billing=True, params={**self.params, 'consolidated': True},
+        )
+
+    def test_unlink_bills(self):
+        bills = self._create_down_payments(self.orders, post=False)
+        bills += self.orders._create_invoices(grouped=True, final=True)
+        self._benchmark('unlink_bills', bills.unlink, params={**self.params, 'bills': len(bills)})
+
+
+@tagged('post_install', '-at_install', 'mjb_benchmark', '-standard')
+class TestPurchaseDownpaymentBenchmark(PurchaseDownpaymentBenchmarkCase):
+    """ Scaling of single hot paths on larger data sets. """
+
+    def test_amount_billed_currency_conversion(self):
+        """ 1,000 PO lines in a foreign currency, each billed 10 times in the company currency. """
+        order = self._create_purchase_orders(line_count=1000, currency=self.foreign_currency)
+        self._create_partial_bills(order, 10, currency=self.env.company.currency_id)
+        lines = order.order_line
+
+        def compute_with_per_line_conversion():
+            # Former implementation: one rate lookup per invoice line and per PO line.
+            for line in lines:
+                amount_billed = 0.0
+                for invoice_line in line._get_invoice_lines():
+                    bill = invoice_line.move_id
+                    if bill.state == 'posted':
+                        amount = invoice_line.currency_id._convert(
+                            invoice_line.price_total, line.currency_id, line.company_id,
+                            bill.invoice_date or fields.Date.context_today(line),
+                        )
+                        amount_billed += amount if bill.move_type == 'in_invoice' else -amount
+                line.amount_billed = amount_billed
+
+        _dummy, queries_before, time_before = self._measure(compute_with_per_line_conversion)
+        expected = {line.id: line.amount_billed for line in lines}
+        _dummy, queries_after, time_after = self._measure(lines._compute_amount_billed)
+
+        params = {'lines': 1000, 'bills_per_line': 10}
+        self._record('amount_billed_per_line_conversion', queries_before, time_before, **params)
+        self._record('compute_amount_billed', queries_after, time_after, **params)
+        for line in lines:
+            self.assertAlmostEqual(line.amount_billed, expected[line.id], places=2)
+        self.assertLess(queries_after, queries_before)
+
+    def test_final_bills_consolidated(self):
+        """ 200 POs with a posted fixed down payment, deducted on 20 consolidated final bills. """
+        orders = self.env['purchase.order']
+        for vendor in self._create_vendors(20):
+            orders += self._create_purchase_orders(order_count=10, line_count=5, partner=vendor)
+        self._create_down_payments(orders, advance_payment_method='fixed', fixed_amount=100.0)
+
+        bills = self._benchmark(
+            'create_invoices', orders._create_invoices, final=True,
+            params={'orders': 200, 'lines_per_order': 5, 'grouped': False, 'final': True},
+        )
+        self.assertEqual(len(bills), 20)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo.tests import tagged
+
+from .common import MjbPurchaseDownpaymentCommon
+
+
+@tagged('post_install', '-at_install')
+class TestBillingJob(MjbPurchaseDownpaymentCommon):
+
+    def _create_job(self, orders, **wizard_values):
+        wizard = self.env['purchase.advance.payment.inv']\
+            .with_context(active_model='purchase.order', active_ids=orders.ids)\
+            .create({'run_in_background': True, **wizard_values})
+        action = wizard.create_invoices()
+        return self.env['purchase.billing.job'].browse(action['res_id'])
+
+    def test_job_bills_orders_by_chunks(self):
+        orders = self._create_purchase_orders(order_count=5)
+        job = self._create_job(orders, advance_payment_method='percentage', amount=30, consolidated_billing=False)
+        job.chunk_size = 2
+        self.assertEqual(job.state, 'queued')
+        self.assertFalse(orders.invoice_ids)
+
+        job._process(auto_commit=False)
+
+        self.assertEqual(job.state, 'done')
+        self.assertEqual(job.processed_count, 5)
+        self.assertEqual(job.progress, 100.0)
+        self.assertEqual(len(job.line_ids.move_ids), 5)
+        for line in job.line_ids:
+            self.assertEqual(line.move_ids, line.order_id.invoice_ids)
+
+    def test_job_records_failing_orders(self):
+        orders = self._create_purchase_orders(order_count=3)
+        # Nothing can be billed on a RFQ: billing it alone fails.
+        rfq = self._create_purchase_orders(confirm=False)
+        job = self._create_job(orders + rfq, advance_payment_method='delivered')
+        job.chunk_size = 3
+
+        job._process(auto_commit=False)
+
+        self.assertEqual(job.state, 'error')
+        self.assertEqual(job.failed_count, 1)
+        failed_line = job.line_ids.filtered(lambda line: line.state == 'failed')
+        self.assertEqual(failed_line.order_id, rfq)
+        self.assertTrue(failed_line.error)
+        self.assertTrue(all(orders.mapped('invoice_ids')))
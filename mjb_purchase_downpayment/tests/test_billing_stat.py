@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo.tests import tagged
+
+from .common import MjbPurchaseDownpaymentCommon
+
+
+@tagged('post_install', '-at_install')
+class TestBillingStat(MjbPurchaseDownpaymentCommon):
+
+    def _stats(self):
+        return self.env['purchase.billing.stat'].search([], order='id')
+
+    def test_profiling_disabled_by_default(self):
+        self._create_purchase_orders(order_count=2)._create_invoices()
+        self.assertFalse(self._stats())
+
+    def test_profiling_phases(self):
+        self.env['ir.config_parameter'].sudo().set_param('mjb_purchase_downpayment.billing_profiling', 'True')
+        orders = self._create_purchase_orders(order_count=3, line_count=2)
+
+        self._create_down_payments(orders, post=False)
+        orders._create_invoices(final=True)
+
+        stats = self._stats()
+        self.assertEqual(len(set(stats.mapped('run'))), 2)
+        down_payment_stats = stats.filtered(lambda s: s.flow == 'down_payment')
+        self.assertEqual(down_payment_stats.mapped('phase')[:3], ['sections', 'down_payment_lines', 'prepare_values'])
+        bill_stats = stats.filtered(lambda s: s.flow == 'create_invoices')
+        self.assertEqual(
+            bill_stats.mapped('phase'),
+            ['invoiceable_lines', 'prepare_values', 'grouping', 'resequencing', 'move_create',
+             'down_payment_rounding', 'chatter'])
+        self.assertEqual(bill_stats.filtered(lambda s: s.phase == 'move_create').row_count, 1)
+        self.assertTrue(all(stat.query_count >= 0 and stat.duration >= 0 for stat in stats))
+
+    def test_profiling_streamed_run(self):
+        self.env['ir.config_parameter'].sudo().set_param('mjb_purchase_downpayment.billing_profiling', 'True')
+        orders = self._create_purchase_orders(order_count=3)
+
+        orders._create_invoices_streamed(grouped=True, chunk_size=2)
+
+        stats = self._stats()
+        self.assertEqual(len(set(stats.mapped('run'))), 1)
+        self.assertEqual(stats.mapped('order_count'), [3] * len(stats))
+        self.assertEqual(stats.mapped('phase'), ['move_create', 'chatter'] * 2)
+        self.assertEqual(sum(stats.filtered(lambda s: s.phase == 'move_create').mapped('row_count')), 3)
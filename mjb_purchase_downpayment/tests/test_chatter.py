@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo.tests import tagged
+
+from .common import MjbPurchaseDownpaymentCommon
+
+
+@tagged('post_install', '-at_install')
+class TestChatter(MjbPurchaseDownpaymentCommon):
+
+    def _origin_link_messages(self, bills):
+        return self.env['mail.message'].search([
+            ('model', '=', 'account.move'),
+            ('res_id', 'in', bills.ids),
+            ('subtype_id', '=', self.env.ref('mail.mt_note').id),
+        ])
+
+    def test_origin_links_posted_in_batch(self):
+        orders = self._create_purchase_orders(order_count=3)
+        bills = self._create_down_payments(orders, post=False)
+        messages = self._origin_link_messages(bills)
+        self.assertEqual(len(messages), 3)
+        for bill in bills:
+            message = messages.filtered(lambda m: m.res_id == bill.id)
+            self.assertIn(bill.line_ids.purchase_line_id.order_id.name, message.body)
+
+    def test_origin_links_skipped(self):
+        orders = self._create_purchase_orders(order_count=3)
+        bills = orders.with_context(mjb_chatter='skip')._create_invoices()
+        self.assertFalse(self._origin_link_messages(bills))
+
+    def test_origin_links_deferred(self):
+        orders = self._create_purchase_orders(order_count=3)
+        bills = orders.with_context(mjb_chatter='defer')._create_invoices(grouped=True)
+        self.assertFalse(self._origin_link_messages(bills))
+        self.env.cr.precommit.run()
+        self.assertEqual(len(self._origin_link_messages(bills)), 3)
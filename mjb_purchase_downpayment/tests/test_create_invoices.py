@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from unittest.mock import patch
+
+from odoo.exceptions import UserError
+from odoo.tests import tagged
+
+from .common import MjbPurchaseDownpaymentCommon
+
+
+@tagged('post_install', '-at_install')
+class TestCreateInvoices(MjbPurchaseDownpaymentCommon):
+
+    @classmethod
+    def setUpClass(cls, chart_template_ref=None):
+        super().setUpClass(chart_template_ref=chart_template_ref)
+        cls.vendors = cls._create_vendors(3)
+        cls.orders = cls._create_vendor_orders()
+
+    @classmethod
+    def _create_vendor_orders(cls):
+        orders = cls.env['purchase.order']
+        for vendor in cls.vendors:
+            orders += cls._create_purchase_orders(order_count=2, line_count=3, partner=vendor)
+        return orders
+
+    def _bills_summary(self, moves):
+        return sorted((move.partner_id.id, move.amount_total, len(move.invoice_line_ids)) for move in moves)
+
+    def test_streamed_matches_create_invoices(self):
+        for grouped in (False, True):
+            with self.subTest(grouped=grouped):
+                expected = self._bills_summary(self._create_vendor_orders()._create_invoices(grouped=grouped))
+
+                moves, failures = self._create_vendor_orders()._create_invoices_streamed(grouped=grouped, chunk_size=2)
+
+                self.assertFalse(failures)
+                self.assertEqual(self._bills_summary(moves), expected)
+
+    def test_streamed_failing_group_is_skipped(self):
+        failing_vendor = self.vendors[1]
+        AccountMove = type(self.env['account.move'])
+        message_post_origin_links = AccountMove._message_post_origin_links
+
+        def _message_post_origin_links(moves, origins=None):
+            if failing_vendor in moves.partner_id:
+                raise UserError("Cannot bill this vendor")
+            return message_post_origin_links(moves, origins)
+
+        with patch.object(AccountMove, '_message_post_origin_links', _message_post_origin_links):
+            moves, failures = self.orders._create_invoices_streamed(chunk_size=2, use_savepoint=True)
+
+        failing_orders = self.orders.filtered(lambda order: order.partner_id == failing_vendor)
+        self.assertEqual(moves.partner_id, self.vendors - failing_vendor)
+        self.assertEqual(set(failures), set(failing_orders.ids))
+        self.assertFalse(failing_orders.invoice_ids)
+
+    def test_grouped_bills_follow_order_sequence(self):
+        moves = self.orders._create_invoices(grouped=False)
+
+        self.assertEqual(moves.partner_id.ids, self.vendors.ids)
+        for move, vendor in zip(moves, self.vendors):
+            self.assertEqual(move.invoice_origin, ', '.join(self.orders.filtered(lambda o: o.partner_id == vendor).mapped('name')))
+
+    def test_company_grouping_fields(self):
+        orders = self._create_purchase_orders(order_count=2, line_count=2, partner=self.vendors[0])
+        orders[0].payment_term_id = self.env.ref('account.account_payment_term_30days')
+
+        self.assertEqual(len(orders._create_invoices()), 1)
+
+        orders = self._create_purchase_orders(order_count=2, line_count=2, partner=self.vendors[0])
+        orders[0].payment_term_id = self.env.ref('account.account_payment_term_30days')
+        self.env.company.purchase_bill_grouping_field_ids = self.env['ir.model.fields']._get('account.move', 'invoice_payment_term_id')
+
+        moves = orders._create_invoices()
+
+        self.assertEqual(len(moves), 2)
+        self.assertEqual(moves.invoice_payment_term_id, orders[0].payment_term_id)
+
+    def test_final_bill_down_payment_rounding(self):
+        """ 10.08 taxes included gives a 8.77 + 1.32 down payment line, rounded to 10.08 on the
+        down payment bill: the final bill must deduct 10.08, not 10.09.
+        """
+        order = self._create_purchase_orders(partner=self.vendors[0])
+        down_payment_bill = self._create_down_payments(order, advance_payment_method='fixed', fixed_amount=10.08)
+        self.assertAlmostEqual(down_payment_bill.amount_total, 10.08, places=2)
+
+        final_bill = order._create_invoices(final=True)
+
+        deduction_line = final_bill.invoice_line_ids.filtered(lambda line: line.purchase_line_id.mjb_is_downpayment)
+        self.assertAlmostEqual(deduction_line.price_total, -10.08, places=2)
+        self.assertAlmostEqual(final_bill.amount_tax, 148.69, places=2)
+        self.assertAlmostEqual(final_bill.amount_total, order.amount_total - 10.08, places=2)
+        payable_line = final_bill.line_ids.filtered(lambda line: line.account_id.account_type == 'liability_payable')
+        self.assertAlmostEqual(payable_line.amount_currency, -final_bill.amount_total, places=2)
+
+    def test_final_bill_down_payment_rounding_spread(self):
+        """ The delta of two rounded down payments is spread over both deduction lines. """
+        order = self._create_purchase_orders(partner=self.vendors[0])
+        for _i in range(2):
+            self._create_down_payments(order, advance_payment_method='fixed', fixed_amount=10.08)
+        AccountMove = type(self.env['account.move'])
+
+        with patch.object(
+            AccountMove, '_get_rounding_delta_commands', autospec=True,
+            side_effect=AccountMove._get_rounding_delta_commands,
+        ) as get_rounding_delta_commands:
+            final_bill = order._create_invoices(final=True)
+
+        get_rounding_delta_commands.assert_called_once()
+        self.assertAlmostEqual(get_rounding_delta_commands.call_args.args[1], 0.02, places=2)
+        deduction_lines = final_bill.invoice_line_ids.filtered(lambda line: line.purchase_line_id.mjb_is_downpayment)
+        self.assertEqual(len(deduction_lines), 2)
+        for deduction_line in deduction_lines:
+            self.assertAlmostEqual(deduction_line.price_total, -10.08, places=2)
+        self.assertAlmostEqual(final_bill.amount_total, order.amount_total - 20.16, places=2)
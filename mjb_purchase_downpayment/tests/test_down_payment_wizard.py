@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from datetime import date
+from unittest.mock import patch
+
+from odoo.fields import Command
+from odoo.tests import tagged
+
+from .common import MjbPurchaseDownpaymentCommon
+
+
+@tagged('post_install', '-at_install')
+class TestDownPaymentWizard(MjbPurchaseDownpaymentCommon):
+
+    def _new_wizard(self, orders, **values):
+        return self.env['purchase.advance.payment.inv']\
+            .with_context(active_model='purchase.order', active_ids=orders.ids)\
+            .create({'advance_payment_method': 'percentage', 'amount': 30, **values})
+
+    def test_deposit_config_cache_invalidation(self):
+        order = self._create_purchase_orders()
+        self.assertEqual(self._new_wizard(order).product_id, self.deposit_product)
+
+        other_deposit_product = self.deposit_product.copy()
+        self.env.company.purchase_down_payment_product_id = other_deposit_product
+        self.assertEqual(self._new_wizard(order).product_id, other_deposit_product)
+
+        other_taxes = self.purchase_tax.copy()
+        other_deposit_product.supplier_taxes_id = [Command.set(other_taxes.ids)]
+        config = self.env['res.company']._get_purchase_down_payment_config(self.env.company.id)
+        self.assertEqual(config[2], tuple(other_taxes.ids))
+
+    def test_multi_order_down_payment(self):
+        orders = self._create_purchase_orders(order_count=2) + self._create_purchase_orders(
+            order_count=2, partner=self.partner_b)
+
+        bills = self._new_wizard(orders, consolidated_billing=True)._create_invoices(orders)
+
+        self.assertEqual(len(bills), 2)
+        self.assertEqual(bills.line_ids.purchase_line_id.order_id, orders)
+        for order in orders:
+            down_payment_lines = order.order_line.filtered('mjb_is_downpayment')
+            self.assertEqual(len(down_payment_lines.filtered('display_type')), 1)
+            self.assertAlmostEqual(
+                sum(down_payment_lines.mapped('price_unit')), order.amount_untaxed * 0.3, places=2)
+
+    def test_down_payment_base_amounts_cache(self):
+        order = self._create_purchase_orders(line_count=3)
+        PurchaseOrder = type(self.env['purchase.order'])
+        compute = PurchaseOrder._compute_down_payment_base_amounts
+
+        with patch.object(PurchaseOrder, '_compute_down_payment_base_amounts', autospec=True, side_effect=compute) as mock:
+            self._create_down_payments(order)
+            self._create_down_payments(order)
+            self.assertEqual(mock.call_count, 1, "Down payment lines should not invalidate the base amounts")
+
+            version = order.mjb_line_version
+            order.order_line[0].price_unit *= 2
+            self.assertNotEqual(order.mjb_line_version, version)
+            self._create_down_payments(order)
+            self.assertEqual(mock.call_count, 2)
+
+        (tax_ids, _distribution), amount = order._get_down_payment_base_amounts()[0]
+        self.assertEqual(tax_ids, tuple(self.purchase_tax.ids))
+        self.assertAlmostEqual(amount, order.amount_untaxed, places=2)
+
+    def test_down_payment_preview(self):
+        orders = self._create_purchase_orders(order_count=2, line_count=3, price_unit=33.33)
+        wizard = self._new_wizard(orders, advance_payment_method='fixed', fixed_amount=100.0, consolidated_billing=False)
+        line_count = self.env['purchase.order.line'].search_count([])
+        bill_count = self.env['account.move'].search_count([])
+
+        preview = wizard.get_down_payment_preview()
+
+        self.assertEqual(self.env['purchase.order.line'].search_count([]), line_count)
+        self.assertEqual(self.env['account.move'].search_count([]), bill_count)
+        self.assertEqual({line['order_id'] for line in preview['lines']}, set(orders.ids))
+        self.assertEqual([tax['tax_id'] for tax in preview['taxes']], self.purchase_tax.ids)
+        self.assertAlmostEqual(preview['amount_total'] + preview['rounding_delta'], 200.0, places=2)
+        self.assertEqual(wizard.down_payment_rounding_delta, preview['rounding_delta'])
+
+        bills = wizard._create_invoices(orders)
+
+        self.assertEqual(len(bills.invoice_line_ids.filtered(lambda l: l.display_type == 'product')), len(preview['lines']))
+        self.assertAlmostEqual(sum(bills.mapped('amount_total')), 200.0, places=2)
+
+    def test_draft_bill_warning(self):
+        orders = self._create_purchase_orders(order_count=2)
+        self._create_down_payments(orders[0])
+        wizard = self._new_wizard(orders)
+        self.assertFalse(wizard.display_draft_bill_warning)
+
+        draft_bill = self._create_down_payments(orders[1], post=False)
+        wizard = self._new_wizard(orders)
+
+        self.assertTrue(wizard.display_draft_bill_warning)
+        self.assertEqual(self.env['account.move'].search(wizard.view_draft_bills()['domain']), draft_bill)
+
+        draft_bill.invoice_date = date(2017, 1, 1)
+        draft_bill.action_post()
+
+        self.assertFalse(self.env['account.move'].search(wizard.view_draft_bills()['domain']))
+
+    def test_domain_selection(self):
+        vendor = self._create_vendors(1)
+        orders = self._create_purchase_orders(order_count=3, partner=vendor)
+        ICP = self.env['ir.config_parameter'].sudo()
+        ICP.set_param('mjb_purchase_downpayment.wizard_domain_threshold', 3)
+        ICP.set_param('mjb_purchase_downpayment.bill_chunk_size', 2)
+        domain = [('partner_id', '=', vendor.id)]
+
+        wizard = self.env['purchase.advance.payment.inv']\
+            .with_context(active_model='purchase.order', active_ids=orders.ids, active_domain=domain)\
+            .create({'advance_payment_method': 'percentage', 'amount': 30, 'consolidated_billing': False})
+
+        self.assertFalse(wizard.purchase_order_ids)
+        self.assertEqual(wizard.purchase_order_domain, repr(domain))
+        self.assertEqual(wizard.count, 3)
+        self.assertEqual(wizard.company_id, self.env.company)
+        self.assertAlmostEqual(wizard.amount_to_bill, sum(orders.mapped('amount_to_bill')), places=2)
+        with patch.object(type(wizard), 'get_down_payment_preview') as get_down_payment_preview:
+            self.assertFalse(wizard.down_payment_amount_total)
+        get_down_payment_preview.assert_not_called()
+
+        wizard.create_invoices()
+
+        self.assertEqual(len(orders.invoice_ids), 3)
+        self.assertTrue(all(order.mjb_down_payment_raised for order in orders))
+
+    def test_partial_selection_keeps_ids(self):
+        vendor = self._create_vendors(1)
+        orders = self._create_purchase_orders(order_count=3, partner=vendor)
+        self.env['ir.config_parameter'].sudo().set_param('mjb_purchase_downpayment.wizard_domain_threshold', 2)
+
+        wizard = self.env['purchase.advance.payment.inv']\
+            .with_context(active_model='purchase.order', active_ids=orders[:2].ids,
+                          active_domain=[('partner_id', '=', vendor.id)])\
+            .create({'advance_payment_method': 'percentage', 'amount': 30})
+
+        self.assertFalse(wizard.purchase_order_domain)
+        self.assertEqual(wizard.purchase_order_ids, orders[:2])
+
+    def test_truncated_domain_selection(self):
+        vendor = self._create_vendors(1)
+        orders = self._create_purchase_orders(order_count=3, partner=vendor)
+        draft_bill = self._create_down_payments(orders[0], post=False)
+        ICP = self.env['ir.config_parameter'].sudo()
+        ICP.set_param('mjb_purchase_downpayment.wizard_domain_threshold', 2)
+        ICP.set_param('web.active_ids_limit', 2)
+
+        # The client sends the first ids of the list as sorted by the user
+        wizard = self.env['purchase.advance.payment.inv']\
+            .with_context(active_model='purchase.order', active_ids=orders[::-1][:2].ids,
+                          active_domain=[('partner_id', '=', vendor.id)])\
+            .create({'advance_payment_method': 'percentage', 'amount': 30})
+
+        self.assertTrue(wizard.purchase_order_domain)
+        self.assertEqual(wizard.count, 3)
+        self.assertTrue(wizard.display_draft_bill_warning)
+        self.assertEqual(self.env['account.move'].search(wizard.view_draft_bills()['domain']), draft_bill)
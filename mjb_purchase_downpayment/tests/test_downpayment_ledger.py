@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from datetime import date
+
+from odoo.tests import tagged
+
+from .common import MjbPurchaseDownpaymentCommon
+
+
+@tagged('post_install', '-at_install')
+class TestDownpaymentLedger(MjbPurchaseDownpaymentCommon):
+
+    def _assert_totals(self, order, raised, posted, deducted):
+        self.assertRecordValues(order, [{
+            'mjb_down_payment_raised': raised,
+            'mjb_down_payment_posted': posted,
+            'mjb_down_payment_deducted': deducted,
+            'mjb_down_payment_outstanding': posted - deducted,
+        }])
+
+    def test_ledger_lifecycle(self):
+        order = self._create_purchase_orders()
+        down_payment_bill = self._create_down_payments(order, post=False)
+        amount = down_payment_bill.amount_total
+        self._assert_totals(order, amount, 0.0, 0.0)
+
+        down_payment_bill.invoice_date = date(2017, 1, 1)
+        down_payment_bill.action_post()
+        self._assert_totals(order, amount, amount, 0.0)
+
+        final_bill = order._create_invoices(final=True)
+        final_bill.invoice_date = date(2017, 1, 1)
+        final_bill.action_post()
+        self._assert_totals(order, amount, amount, amount)
+
+        final_bill.button_draft()
+        self._assert_totals(order, amount, amount, 0.0)
+
+        final_bill.button_cancel()
+        down_payment_bill.button_cancel()
+        self._assert_totals(order, 0.0, 0.0, 0.0)
+        self.assertEqual(
+            order.mjb_down_payment_ledger_ids.filtered(lambda e: e.entry_type == 'cancelled').cancelled_entry_id,
+            order.mjb_down_payment_ledger_ids.filtered('is_cancelled'))
+
+    def test_ledger_drives_has_down_payments(self):
+        orders = self._create_purchase_orders(order_count=2)
+        wizard = self.env['purchase.advance.payment.inv']\
+            .with_context(active_model='purchase.order', active_ids=orders.ids)\
+            .create({'advance_payment_method': 'delivered'})
+        self.assertFalse(wizard.has_down_payments)
+
+        bills = self._create_down_payments(orders[0], post=False)
+        wizard.invalidate_recordset(['has_down_payments'])
+        self.assertTrue(wizard.has_down_payments)
+
+        bills.unlink()
+        self.assertFalse(orders[0].mjb_down_payment_raised)
+
+    def test_ledger_amounts_of_final_bills(self):
+        order = self._create_purchase_orders()
+        posted_bill = self._create_down_payments(order)
+        draft_bill = self._create_down_payments(order, post=False)
+        reset_bill = self._create_down_payments(order)
+        reset_bill.button_draft()
+        cancelled_bill = self._create_down_payments(order)
+        cancelled_bill.button_cancel()
+
+        amounts = order._get_down_payment_ledger_amounts(self.env['account.move'])
+
+        # Deposits count once, raised or posted, with the sign of a vendor bill line
+        for bill in posted_bill + draft_bill + reset_bill:
+            self.assertAlmostEqual(amounts[bill.invoice_line_ids.purchase_line_id.id], -bill.amount_total, places=2)
+        self.assertFalse(amounts.get(cancelled_bill.invoice_line_ids.purchase_line_id.id))
+        self.assertFalse(order._get_down_payment_ledger_amounts(posted_bill).get(posted_bill.invoice_line_ids.purchase_line_id.id))
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from datetime import date, timedelta
+from unittest.mock import patch
+
+from odoo.exceptions import UserError
+from odoo.fields import Command
+from odoo.tests import tagged
+
+from .common import MjbPurchaseDownpaymentCommon
+
+
+@tagged('post_install', '-at_install')
+class TestDownpaymentMilestone(MjbPurchaseDownpaymentCommon):
+
+    def _set_schedule(self, orders, due_date):
+        orders.write({'mjb_milestone_ids': [
+            Command.create({'name': "Confirmation", 'trigger': 'confirmation', 'amount': 30}),
+            Command.create({'name': "Date", 'trigger': 'date', 'date': due_date, 'amount': 40}),
+            Command.create({'name': "Receipt", 'trigger': 'receipt', 'amount': 30}),
+        ]})
+
+    def test_raise_due_milestones(self):
+        orders = self._create_purchase_orders(order_count=3)
+        self._set_schedule(orders, date.today() + timedelta(days=10))
+        Milestone = self.env['purchase.downpayment.milestone']
+
+        Milestone._cron_raise_due_milestones(chunk_size=2)
+
+        raised = orders.mjb_milestone_ids.filtered(lambda m: m.state == 'raised')
+        self.assertEqual(raised.mapped('name'), ["Confirmation"] * 3)
+        self.assertEqual(len(raised.move_id), 3)
+        for milestone in raised:
+            self.assertEqual(milestone.move_id.line_ids.purchase_line_id.order_id, milestone.order_id)
+            self.assertAlmostEqual(milestone.move_id.amount_untaxed, milestone.order_id.amount_untaxed * 0.3, places=2)
+
+        orders.mjb_milestone_ids.filtered(lambda m: m.trigger == 'date').date = date.today()
+        orders[0].order_line.qty_received = 1.0
+        Milestone._cron_raise_due_milestones()
+
+        self.assertEqual(
+            orders.mjb_milestone_ids.filtered(lambda m: m.state == 'pending'),
+            orders[1:].mjb_milestone_ids.filtered(lambda m: m.trigger == 'receipt'))
+        self.assertEqual(len(orders[0].mjb_milestone_ids.move_id), 3)
+
+    def test_milestones_of_draft_orders_are_not_raised(self):
+        order = self._create_purchase_orders(confirm=False)
+        self._set_schedule(order, date.today())
+
+        self.env['purchase.downpayment.milestone']._cron_raise_due_milestones()
+
+        self.assertEqual(set(order.mjb_milestone_ids.mapped('state')), {'pending'})
+
+    def test_successive_milestones_share_base_amounts(self):
+        order = self._create_purchase_orders(line_count=3)
+        order.write({'mjb_milestone_ids': [
+            Command.create({'name': "First", 'trigger': 'confirmation', 'amount': 30}),
+            Command.create({'name': "Second", 'trigger': 'confirmation', 'amount': 20}),
+        ]})
+        PurchaseOrder = type(self.env['purchase.order'])
+        compute = PurchaseOrder._compute_down_payment_base_amounts
+
+        with patch.object(PurchaseOrder, '_compute_down_payment_base_amounts', autospec=True, side_effect=compute) as mock:
+            self.env['purchase.downpayment.milestone']._cron_raise_due_milestones()
+
+        self.assertEqual(set(order.mjb_milestone_ids.mapped('state')), {'raised'})
+        self.assertEqual(len(order.mjb_milestone_ids.move_id), 2)
+        self.assertEqual(mock.call_count, 1, "The second milestone should reuse the cached base amounts")
+
+    def test_raised_milestones_cannot_be_deleted(self):
+        order = self._create_purchase_orders()
+        self._set_schedule(order, date.today() + timedelta(days=10))
+        self.env['purchase.downpayment.milestone']._cron_raise_due_milestones()
+        raised = order.mjb_milestone_ids.filtered(lambda m: m.state == 'raised')
+
+        with self.assertRaises(UserError):
+            raised.unlink()
+
+        (order.mjb_milestone_ids - raised).unlink()
+        self.assertEqual(order.mjb_milestone_ids, raised)
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from datetime import date
+
+from odoo.tests import tagged
+
+from .common import MjbPurchaseDownpaymentCommon
+
+
+@tagged('post_install', '-at_install')
+class TestDownpaymentReport(MjbPurchaseDownpaymentCommon):
+
+    def _outstanding_per_vendor(self, orders):
+        self.env.flush_all()
+        return {
+            partner: amount
+            for partner, amount in self.env['purchase.downpayment.report']._read_group(
+                [('order_id', 'in', orders.ids)], ['partner_id'], ['amount_outstanding:sum'])
+        }
+
+    def test_deposit_exposure(self):
+        vendors = self._create_vendors(2)
+        orders = self._create_purchase_orders(partner=vendors[0]) + self._create_purchase_orders(partner=vendors[1])
+        bills = self._create_down_payments(orders)
+
+        outstanding = self._outstanding_per_vendor(orders)
+        for vendor, bill in zip(vendors, bills):
+            self.assertAlmostEqual(outstanding[vendor], bill.amount_total, places=2)
+
+        final_bill = orders[0]._create_invoices(final=True)
+        final_bill.invoice_date = date(2017, 1, 1)
+        final_bill.action_post()
+
+        outstanding = self._outstanding_per_vendor(orders)
+        self.assertAlmostEqual(outstanding[vendors[0]], 0.0, places=2)
+        self.assertAlmostEqual(outstanding[vendors[1]], bills[1].amount_total, places=2)
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo.tests import tagged
+
+from .common import MjbPurchaseDownpaymentCommon
+
+
+@tagged('post_install', '-at_install')
+class TestIndexes(MjbPurchaseDownpaymentCommon):
+
+    def _explain(self, query, params):
+        self.env.flush_all()
+        self.env.cr.execute("SET LOCAL enable_seqscan = off")
+        self.env.cr.execute("EXPLAIN " + query, params)
+        return "\n".join(row[0] for row in self.env.cr.fetchall())
+
+    def test_down_payment_queries_use_indexes(self):
+        orders = self._create_purchase_orders(order_count=2)
+        bills = self._create_down_payments(orders)
+        down_payment_lines = bills.line_ids.purchase_line_id
+
+        plan = self._explain("""
+            SELECT id FROM purchase_order_line WHERE order_id = ANY(%s) AND mjb_is_downpayment
+        """, [orders.ids])
+        self.assertIn('purchase_order_line_mjb_downpayment_order_id_index', plan)
+
+        # AccountMove.unlink
+        plan = self._explain("""
+            SELECT DISTINCT aml.purchase_line_id
+              FROM account_move_line aml
+              JOIN account_move am ON am.id = aml.move_id
+             WHERE aml.purchase_line_id = ANY(%s)
+               AND am.state = 'posted'
+        """, [down_payment_lines.ids])
+        self.assertIn('account_move_line_purchase_line_id_move_id_index', plan)
+
+        # purchase.order._get_draft_bill_ids
+        plan = self._explain("""
+            SELECT DISTINCT aml.move_id
+              FROM purchase_order_line pol
+              JOIN account_move_line aml ON aml.purchase_line_id = pol.id
+              JOIN account_move am ON am.id = aml.move_id
+             WHERE pol.order_id = ANY(%s)
+               AND am.state = 'draft'
+        """, [orders.ids])
+        self.assertIn('account_move_line_purchase_line_id_move_id_index', plan)
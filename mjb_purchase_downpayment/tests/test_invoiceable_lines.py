@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo.fields import Command
+from odoo.tests import tagged
+
+from .common import MjbPurchaseDownpaymentCommon
+
+
+@tagged('post_install', '-at_install')
+class TestInvoiceableLines(MjbPurchaseDownpaymentCommon):
+
+    def _create_order_with_sections(self):
+        order = self.env['purchase.order'].create({
+            'partner_id': self.vendor.id,
+            'order_line': [
+                Command.create({'display_type': 'line_section', 'name': 'Section A'}),
+                Command.create({'product_id': self.product_ordered.id, 'product_qty': 10.0, 'price_unit': 100.0}),
+                Command.create({'display_type': 'line_note', 'name': 'Note'}),
+                Command.create({'display_type': 'line_section', 'name': 'Section B'}),
+                Command.create({'product_id': self.product_ordered.id, 'product_qty': 0.0, 'price_unit': 100.0}),
+            ],
+        })
+        order.button_confirm()
+        self._create_down_payments(order)
+        return order
+
+    def _get_expected_line_ids(self, order, final):
+        section_a, product_line, note = order.order_line[:3]
+        down_payment_line = order.order_line.filtered(lambda line: line.mjb_is_downpayment and not line.display_type)
+        expected_lines = section_a + product_line + note
+        if final:
+            expected_lines += down_payment_line
+        return expected_lines.ids
+
+    def test_invoiceable_lines_order(self):
+        order = self._create_order_with_sections()
+
+        self.assertEqual(order._get_invoiceable_lines().ids, self._get_expected_line_ids(order, False))
+        self.assertEqual(order._get_invoiceable_lines(final=True).ids, self._get_expected_line_ids(order, True))
+
+    def test_invoiceable_lines_per_order(self):
+        orders = self._create_order_with_sections() + self._create_order_with_sections()
+        for final in (False, True):
+            lines_per_order = orders._get_invoiceable_lines_per_order(final)
+            self.assertEqual(list(lines_per_order), orders.ids)
+            for order in orders:
+                self.assertEqual(lines_per_order[order.id].ids, self._get_expected_line_ids(order, final))
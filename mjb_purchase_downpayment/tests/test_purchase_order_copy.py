@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo.tests import tagged
+
+from .common import MjbPurchaseDownpaymentCommon
+
+
+@tagged('post_install', '-at_install')
+class TestPurchaseOrderCopy(MjbPurchaseDownpaymentCommon):
+
+    def test_copy_data_multi_orders(self):
+        orders = self._create_purchase_orders(order_count=2, line_count=3)
+        orders[1].order_line[0].price_unit = 42.0
+        self._create_down_payments(orders)
+
+        orders_values = orders.copy_data()
+
+        self.assertEqual(len(orders_values), 2)
+        copies = self.env['purchase.order'].create(orders_values)
+        for order, copy in zip(orders, copies):
+            self.assertFalse(copy.order_line.filtered('mjb_is_downpayment'))
+            self.assertEqual(
+                copy.order_line.mapped('price_unit'),
+                order.order_line.filtered(lambda l: not l.mjb_is_downpayment).mapped('price_unit'))
+        self.assertEqual(copies[1].order_line[0].price_unit, 42.0)
+
+    def test_copy_without_down_payment_lines(self):
+        order = self._create_purchase_orders(line_count=2)
+        self._create_down_payments(order)
+
+        copy = order.copy()
+
+        self.assertEqual(len(copy.order_line), 2)
+        self.assertFalse(copy.order_line.filtered('mjb_is_downpayment'))
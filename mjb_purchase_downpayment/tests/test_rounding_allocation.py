@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import random
+
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestRoundingAllocation(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.currencies = [
+            cls.env['res.currency'].new({'name': 'R%s' % index, 'symbol': 'R', 'rounding': rounding})
+            for index, rounding in enumerate((0.01, 0.05, 0.001, 1.0))
+        ]
+
+    @staticmethod
+    def _allocate_line_by_line(delta_amount, currency, count):
+        """ The allocation made line by line before the largest remainder method. """
+        amounts = []
+        remaining = delta_amount
+        delta_sign = 1 if delta_amount > 0 else -1
+        for _index in range(count):
+            if currency.compare_amounts(remaining, 0) != delta_sign:
+                break
+            amount = delta_sign * max(currency.rounding, abs(currency.round(remaining / count)))
+            remaining -= amount
+            amounts.append(amount)
+        return amounts + [0.0] * (count - len(amounts))
+
+    def test_allocation_randomized(self):
+        rng = random.Random(42)
+        AccountMove = self.env['account.move']
+        for currency in self.currencies:
+            for _iteration in range(200):
+                count = rng.randint(1, 30)
+                units = rng.randint(-3 * count, 3 * count)
+                delta_amount = currency.round(units * currency.rounding)
+
+                amounts = AccountMove._allocate_rounding_delta(delta_amount, currency, count)
+
+                self.assertEqual(len(amounts), count)
+                self.assertTrue(currency.is_zero(sum(amounts) - delta_amount))
+                self.assertLessEqual(
+                    currency.round(max(amounts) - min(amounts)), currency.rounding,
+                    "Allocated amounts should differ by one unit at most")
+                if abs(units) <= count:
+                    expected = self._allocate_line_by_line(delta_amount, currency, count)
+                    for amount, expected_amount in zip(amounts, expected):
+                        self.assertTrue(currency.is_zero(amount - expected_amount))
+
+    def test_allocation_weighted(self):
+        currency = self.currencies[0]
+        amounts = self.env['account.move']._allocate_rounding_delta(0.1, currency, 3, weights=[1, 1, 3])
+        self.assertEqual(amounts, [0.02, 0.02, 0.06])
@@ -1,23 +1,72 @@
 # -*- coding: utf-8 -*-
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
+import logging
+import time
+from ast import literal_eval
+from collections import defaultdict
+
 from odoo import _, api, fields, models, SUPERUSER_ID
 from odoo.exceptions import UserError
 from odoo.fields import Command
-from odoo.tools import format_date, frozendict
+from odoo.osv import expression
+from odoo.tools import format_date, split_every
+
+_logger = logging.getLogger(__name__)
 
 
 class purchaseAdvancePaymentInv(models.TransientModel):
     _name = 'purchase.advance.payment.inv'
     _description = "purchases Advance Payment Bill"
     
+    @api.model
+    def _default_purchase_order_domain(self):
+        """ Return the active domain when the user selected all the orders of a large filtered
+        list, so that the wizard keeps the domain instead of storing every order id.
+
+        The domain is kept when at least `mjb_purchase_downpayment.wizard_domain_threshold`
+        orders are selected, all of them matching the domain, and either every order of the
+        domain is selected or the client truncated the selection to `web.active_ids_limit`
+        ids. The selected ids are compared as a set, the list may be sorted in any way.
+        """
+        context = self.env.context
+        active_ids = context.get('active_ids') or []
+        if context.get('active_model') != 'purchase.order' or not context.get('active_domain'):
+            return False
+        threshold = int(self.env['ir.config_parameter'].sudo().get_param(
+            'mjb_purchase_downpayment.wizard_domain_threshold', 1000))
+        if len(active_ids) < threshold:
+            return False
+        domain = context['active_domain']
+        PurchaseOrder = self.env['purchase.order']
+        active_ids = set(active_ids)
+        if PurchaseOrder.search_count(expression.AND([domain, [('id', 'in', list(active_ids))]])) != len(active_ids):
+            return False
+        active_ids_limit = int(self.env['ir.config_parameter'].sudo().get_param('web.active_ids_limit', 20000))
+        if len(active_ids) < active_ids_limit and PurchaseOrder.search_count(domain) != len(active_ids):
+            # Only part of the domain was selected
+            return False
+        return repr(domain)
+
+    @api.model
+    def default_get(self, fields_list):
+        res = super().default_get(fields_list)
+        # Both defaults depend on the selection mode, decided once
+        if {'purchase_order_ids', 'purchase_order_domain'}.intersection(fields_list):
+            domain = self._default_purchase_order_domain()
+            if 'purchase_order_domain' in fields_list and 'purchase_order_domain' not in res:
+                res['purchase_order_domain'] = domain
+            if 'purchase_order_ids' in fields_list and 'purchase_order_ids' not in res:
+                res['purchase_order_ids'] = [Command.set([] if domain else self.env.context.get('active_ids') or [])]
+        return res
+
     @api.model
     def _default_deposit_account_id(self):
-        return self.product_id._get_product_accounts()['expense']
+        return self.env['account.account'].browse(self._get_deposit_config(self.env.company)[1])
 
     @api.model
     def _default_deposit_taxes_id(self):
-        return self.product_id.supplier_taxes_id
+        return self.env['account.tax'].browse(self._get_deposit_config(self.env.company)[2])
 
     advance_payment_method = fields.Selection(
         selection=[
@@ -31,8 +80,11 @@ class purchaseAdvancePaymentInv(models.TransientModel):
         help="A standard Bill is issued with all the order lines ready for invoicing,"
             "according to their invoicing policy (based on ordered or delivered quantity).")
     count = fields.Integer(string="Order Count", compute='_compute_count')
-    purchase_order_ids = fields.Many2many(
-        'purchase.order', default=lambda self: self.env.context.get('active_ids'))
+    purchase_order_ids = fields.Many2many('purchase.order')
+    purchase_order_domain = fields.Char(
+        string="Selected Orders Domain",
+        help="Domain of the selected orders, when all the orders of a large filtered list are selected.\n"
+             "The orders are then searched when billed instead of being stored on the wizard.")
 
     # Down Payment logic
     has_down_payments = fields.Boolean(
@@ -88,6 +140,16 @@ class purchaseAdvancePaymentInv(models.TransientModel):
         help="Taxes used for deposits",
         default=_default_deposit_taxes_id)
 
+    # Preview of the down payment bills, see get_down_payment_preview
+    down_payment_amount_total = fields.Monetary(
+        string="Down Payment Total",
+        compute='_compute_down_payment_preview',
+        help="Total, taxes included, of the down payment bills.")
+    down_payment_rounding_delta = fields.Monetary(
+        string="Rounding Adjustment",
+        compute='_compute_down_payment_preview',
+        help="Amount spread over the bill lines so that the bills total the fixed amount.")
+
     # UI
     display_draft_bill_warning = fields.Boolean(compute="_compute_display_draft_bill_warning")
     display_bill_amount_warning = fields.Boolean(compute="_compute_display_bill_amount_warning")
@@ -95,67 +157,152 @@ class purchaseAdvancePaymentInv(models.TransientModel):
         string="Consolidated Billing", default=True,
         help="Create one bill for all orders related to same customer and same invoicing address"
     )
+    run_in_background = fields.Boolean(
+        string="Run in Background",
+        help="Bill the orders by chunks in a scheduled job instead of waiting for the whole run.\n"
+             "Bills of a chunk are committed together, and the progress is tracked on the job."
+    )
 
     #=== COMPUTE METHODS ===#
 
-    @api.depends('purchase_order_ids')
+    @api.depends('purchase_order_ids', 'purchase_order_domain')
     def _compute_count(self):
         for wizard in self:
-            wizard.count = len(wizard.purchase_order_ids)
+            domain = wizard._get_purchase_order_domain()
+            if domain is None:
+                wizard.count = len(wizard.purchase_order_ids)
+            else:
+                wizard.count = self.env['purchase.order'].search_count(domain)
 
-    @api.depends('purchase_order_ids')
+    @api.depends('purchase_order_ids', 'purchase_order_domain')
     def _compute_has_down_payments(self):
         for wizard in self:
-            wizard.has_down_payments = bool(
-                wizard.purchase_order_ids.order_line.filtered('mjb_is_downpayment')
-            )
+            domain = wizard._get_purchase_order_domain()
+            if domain is None:
+                wizard.has_down_payments = any(
+                    order.mjb_down_payment_raised or order.mjb_down_payment_posted
+                    for order in wizard.purchase_order_ids
+                )
+            else:
+                wizard.has_down_payments = bool(self.env['purchase.order'].search_count(domain + [
+                    '|', ('mjb_down_payment_raised', '!=', 0), ('mjb_down_payment_posted', '!=', 0),
+                ], limit=1))
 
     # next computed fields are only used for down payments bills and therefore should only
-    # have a value when 1 unique PO is billed through the wizard
-    @api.depends('purchase_order_ids')
+    # have a value when the billed POs share the same currency / company
+    @api.depends('purchase_order_ids', 'purchase_order_domain')
     def _compute_currency_id(self):
         self.currency_id = False
         for wizard in self:
-            if wizard.count == 1:
-                wizard.currency_id = wizard.purchase_order_ids.currency_id
+            currencies = wizard._get_purchase_order_values('currency_id')
+            if len(currencies) == 1:
+                wizard.currency_id = currencies
 
-    @api.depends('purchase_order_ids')
+    @api.depends('purchase_order_ids', 'purchase_order_domain')
     def _compute_company_id(self):
         self.company_id = False
         for wizard in self:
-            if wizard.count == 1:
-                wizard.company_id = wizard.purchase_order_ids.company_id
+            companies = wizard._get_purchase_order_values('company_id')
+            if len(companies) == 1:
+                wizard.company_id = companies
 
     @api.depends('company_id')
     def _compute_product_id(self):
         self.product_id = False
         for wizard in self:
-            if wizard.count == 1:
-                product_id = self.env['ir.config_parameter'].get_param("mjb_purchase_downpayment.mjb_deposit_product_id",False)
-                if not product_id:
-                    product =  wizard.company_id.purchase_down_payment_product_id
-                else:
-                    product = self.env['product.product'].browse(int(product_id))
-                wizard.product_id = product
+            if wizard.company_id:
+                wizard.product_id = self.env['product.product'].browse(self._get_deposit_config(wizard.company_id)[0])
 
     @api.depends('amount', 'fixed_amount', 'advance_payment_method', 'amount_to_bill')
     def _compute_display_bill_amount_warning(self):
         for wizard in self:
-            bill_amount = wizard.fixed_amount
+            # The fixed amount is billed on each of the selected orders
+            bill_amount = wizard.fixed_amount * wizard.count
             if wizard.advance_payment_method == 'percentage':
-                bill_amount = wizard.amount / 100 * sum(wizard.purchase_order_ids.mapped('amount_total'))
+                bill_amount = wizard.amount / 100 * wizard._get_purchase_order_totals()['amount_total']
             wizard.display_bill_amount_warning = bill_amount > wizard.amount_to_bill
 
-    @api.depends('purchase_order_ids')
-    def _compute_display_draft_bill_warning(self):
+    @api.depends('advance_payment_method', 'amount', 'fixed_amount', 'purchase_order_ids', 'purchase_order_domain')
+    def _compute_down_payment_preview(self):
         for wizard in self:
-            wizard.display_draft_bill_warning = wizard.purchase_order_ids.invoice_ids.filtered(lambda bill: bill.state == 'draft')
+            if wizard.purchase_order_domain:
+                # Not previewed for a domain, the fields are hidden
+                wizard.down_payment_amount_total = 0.0
+                wizard.down_payment_rounding_delta = 0.0
+                continue
+            preview = wizard.get_down_payment_preview()
+            wizard.down_payment_amount_total = preview['amount_total']
+            wizard.down_payment_rounding_delta = preview['rounding_delta']
 
-    @api.depends('purchase_order_ids')
+    @api.depends('purchase_order_ids', 'purchase_order_domain')
+    def _compute_display_draft_bill_warning(self):
+        for wizard in self:
+            domain = wizard._get_purchase_order_domain()
+            if domain is None:
+                draft_bill_ids = wizard.purchase_order_ids._origin._get_draft_bill_ids(limit=1)
+            else:
+                draft_bill_ids = self.env['purchase.order']._get_draft_bill_ids(limit=1, order_domain=domain)
+            wizard.display_draft_bill_warning = bool(draft_bill_ids)
+
+    @api.depends('purchase_order_ids', 'purchase_order_domain')
     def _compute_bill_amounts(self):
         for wizard in self:
-            wizard.amount_billed = sum(wizard.purchase_order_ids._origin.mapped('amount_billed'))
-            wizard.amount_to_bill = sum(wizard.purchase_order_ids._origin.mapped('amount_to_bill'))
+            totals = wizard._get_purchase_order_totals()
+            wizard.amount_billed = totals['amount_billed']
+            wizard.amount_to_bill = totals['amount_to_bill']
+
+    #=== SELECTION METHODS ===#
+
+    def _get_purchase_order_domain(self):
+        """ Return the domain of the selected orders, or None when they are stored in
+        `purchase_order_ids`.
+        """
+        self.ensure_one()
+        return literal_eval(self.purchase_order_domain) if self.purchase_order_domain else None
+
+    def _get_purchase_orders(self):
+        """ Return the selected orders. With a domain, only their ids are fetched, ordered so
+        that the orders of a same vendor are close to each other.
+        """
+        self.ensure_one()
+        domain = self._get_purchase_order_domain()
+        if domain is None:
+            return self.purchase_order_ids._origin
+        return self.env['purchase.order'].search(domain, order='partner_id, currency_id, id')
+
+    def _get_purchase_order_values(self, fname):
+        """ Return the distinct values of the many2one `fname` of the selected orders. """
+        self.ensure_one()
+        domain = self._get_purchase_order_domain()
+        if domain is None:
+            return self.purchase_order_ids[fname]
+        comodel = self.env[self.env['purchase.order']._fields[fname].comodel_name]
+        return comodel.concat(*(
+            value for value, in self.env['purchase.order']._read_group(domain, [fname], limit=2)
+        ))
+
+    def _get_purchase_order_totals(self):
+        """ Return the total, billed and unbilled amounts of the selected orders, summed by
+        the database for a domain.
+
+        :rtype: dict
+        """
+        self.ensure_one()
+        fnames = ('amount_total', 'amount_billed', 'amount_to_bill')
+        domain = self._get_purchase_order_domain()
+        if domain is None:
+            orders = self.purchase_order_ids._origin
+            return {fname: sum(orders.mapped(fname)) for fname in fnames}
+        [totals] = self.env['purchase.order']._read_group(domain, [], [f'{fname}:sum' for fname in fnames])
+        return {fname: total or 0.0 for fname, total in zip(fnames, totals)}
+
+    @api.model
+    def _get_deposit_config(self, company):
+        """ Return the ids of the deposit product, expense account and supplier taxes of `company`.
+
+        See :meth:`res.company._get_purchase_down_payment_config`, cached per company.
+        """
+        return self.env['res.company']._get_purchase_down_payment_config(company.id)
 
     #=== ONCHANGE METHODS ===#
 
@@ -174,10 +321,27 @@ class purchaseAdvancePaymentInv(models.TransientModel):
             elif wizard.advance_payment_method == 'fixed' and wizard.fixed_amount <= 0.00:
                 raise UserError(_('The value of the down payment amount must be positive.'))
 
+    def _check_down_payment_orders(self, purchase_orders):
+        self.ensure_one()
+        if len(purchase_orders.company_id) > 1:
+            raise UserError(_("Down payments can only be billed on purchase orders of the same company."))
+        if self.advance_payment_method == 'fixed' and len(purchase_orders.currency_id) > 1:
+            raise UserError(_(
+                "A fixed down payment amount can only be billed on purchase orders in the same currency."
+            ))
+
+    def _check_down_payment_selection(self, purchase_orders):
+        """ Same as :meth:`_check_down_payment_orders`, without reading the orders when the
+        selection shares a company and a currency, see `company_id` and `currency_id`.
+        """
+        self.ensure_one()
+        if not self.company_id or (self.advance_payment_method == 'fixed' and not self.currency_id):
+            self._check_down_payment_orders(purchase_orders)
+
     @api.constrains('product_id')
     def _check_down_payment_product_is_valid(self):
         for wizard in self:
-            if wizard.count > 1 or not wizard.product_id or wizard.advance_payment_method == 'delivered':
+            if not wizard.product_id or wizard.advance_payment_method == 'delivered':
                 continue
             if wizard.product_id.purchase_method != 'purchase':
                 raise UserError(_(
@@ -193,17 +357,33 @@ class purchaseAdvancePaymentInv(models.TransientModel):
 
     def create_invoices(self):
         self._check_amount_is_positive()
-        bills = self._create_invoices(self.purchase_order_ids)
-        return self.purchase_order_ids.action_view_invoice(bills)
+        if self.run_in_background:
+            return self._create_billing_job()
+        purchase_orders = self._get_purchase_orders()
+        if self.purchase_order_domain:
+            bills = self._create_invoices_by_chunks(purchase_orders)
+        else:
+            bills = self._create_invoices(purchase_orders)
+        return purchase_orders.action_view_invoice(bills)
 
     def view_draft_bills(self):
+        domain = self._get_purchase_order_domain()
+        if domain is None:
+            order_condition = ('line_ids.purchase_line_id.order_id', 'in', self.purchase_order_ids._origin.ids)
+        else:
+            order_condition = ('line_ids.purchase_line_id.order_id', 'any', domain)
         return {
             'name': _('Draft Bills'),
             'type': 'ir.actions.act_window',
             'view_mode': 'tree',
             'views': [(False, 'list'), (False, 'form')],
             'res_model': 'account.move',
-            'domain': [('line_ids.purchase_line_ids.order_id', 'in', self.purchase_order_ids.ids), ('state', '=', 'draft')],
+            # Kept relational, so the list stays correct when the bills change
+            'domain': [
+                order_condition,
+                ('state', '=', 'draft'),
+                ('move_type', 'in', ('in_invoice', 'in_refund')),
+            ],
         }
 
     #=== BUSINESS METHODS ===#
@@ -213,81 +393,251 @@ class purchaseAdvancePaymentInv(models.TransientModel):
         if self.advance_payment_method == 'delivered':
             return purchase_orders._create_invoices(final=self.deduct_down_payments, grouped=not self.consolidated_billing)
         else:
-            self.purchase_order_ids.ensure_one()
-            self = self.with_company(self.company_id)
-            order = self.purchase_order_ids
+            return self._create_down_payment_bills(purchase_orders)
 
-            # Create deposit product if necessary
-            if not self.product_id:
-                self.company_id.sudo().purchase_down_payment_product_id = self.env['product.product'].create(
-                    self._prepare_down_payment_product_values()
-                )
-                self._compute_product_id()
+    def _create_invoices_by_chunks(self, purchase_orders):
+        """ Bill `purchase_orders` by chunks of `mjb_purchase_downpayment.bill_chunk_size`
+        orders, flushing and clearing the cache after each chunk.
 
-            # Create down payment section if necessary
-            purchaseOrderline = self.env['purchase.order.line'].with_context(purchase_no_log_for_new_lines=True)
-            if not any(line.display_type and line.mjb_is_downpayment for line in order.order_line):
-                purchaseOrderline.create(
-                    self._prepare_down_payment_section_values(order)
+        :return: the created bills
+        :rtype: `account.move` recordset
+        """
+        self.ensure_one()
+        chunk_size = int(self.env['ir.config_parameter'].sudo().get_param(
+            'mjb_purchase_downpayment.bill_chunk_size', 100))
+        if self.advance_payment_method == 'delivered':
+            bills, _failures = purchase_orders._create_invoices_streamed(
+                grouped=not self.consolidated_billing, final=self.deduct_down_payments, chunk_size=chunk_size)
+            return bills
+
+        bill_ids = []
+        for order_ids in split_every(chunk_size, purchase_orders.ids):
+            bill_ids += self._create_down_payment_bills(self.env['purchase.order'].browse(order_ids)).ids
+            self.env.flush_all()
+            self.env.invalidate_all()
+        return self.env['account.move'].browse(bill_ids)
+
+    def _create_down_payment_bills(self, purchase_orders):
+        """ Bill a down payment on each of the given orders.
+
+        The down payment sections, the down payment lines and the bills of all orders are
+        created with one `create` call each. Bills are consolidated by
+        :meth:`purchase.order._get_invoice_grouping_keys` when `consolidated_billing` is set.
+
+        :param purchase_orders: `purchase.order` recordset
+        :return: the created bills
+        :rtype: `account.move` recordset
+        """
+        self.ensure_one()
+        self._check_down_payment_orders(purchase_orders)
+        start = time.perf_counter()
+        profiler = self.env['purchase.billing.stat']._profiler('down_payment', len(purchase_orders))
+        self = self.with_company(self.company_id)
+
+        self._ensure_down_payment_product()
+
+        # Create down payment sections if necessary
+        purchaseOrderline = self.env['purchase.order.line'].with_context(purchase_no_log_for_new_lines=True)
+        with profiler.phase('sections') as phase:
+            sections = purchaseOrderline.create([
+                self._prepare_down_payment_section_values(order)
+                for order in purchase_orders
+                if not any(line.display_type and line.mjb_is_downpayment for line in order.order_line)
+            ])
+            phase['rows'] = len(sections)
+
+        with profiler.phase('down_payment_lines') as phase:
+            down_payment_lines_values = []
+            for order in purchase_orders:
+                down_payment_lines_values += self._prepare_down_payment_lines_values(order)
+            down_payment_lines = purchaseOrderline.create(down_payment_lines_values)
+            phase['rows'] = len(down_payment_lines)
+        down_payment_lines_per_order = defaultdict(lambda: self.env['purchase.order.line'])
+        for line in down_payment_lines:
+            down_payment_lines_per_order[line.order_id] |= line
+
+        with profiler.phase('prepare_values') as phase:
+            bill_vals_list = [
+                self._prepare_invoice_values(order, down_payment_lines_per_order[order])
+                for order in purchase_orders
+            ]
+            phase['rows'] = len(bill_vals_list)
+        if self.consolidated_billing and len(purchase_orders) > 1:
+            with profiler.phase('grouping') as phase:
+                bill_vals_list = purchase_orders._group_bill_vals(bill_vals_list)
+                phase['rows'] = len(bill_vals_list)
+        with profiler.phase('move_create') as phase:
+            bills = self.env['account.move'].sudo().create(bill_vals_list)
+            phase['rows'] = len(bills)
+
+        # Ensure the bill total is exactly the expected fixed amount.
+        if self.advance_payment_method == 'fixed':
+            with profiler.phase('fixed_amount_rounding') as phase:
+                for bill in bills:
+                    bill_orders = bill.line_ids.purchase_line_id.order_id
+                    self._apply_fixed_amount_rounding(bill, self.fixed_amount * len(bill_orders))
+                phase['rows'] = len(bills)
+
+        with profiler.phase('ledger') as phase:
+            phase['rows'] = len(self.env['purchase.downpayment.ledger']._log_raised(bills))
+
+        # Unsudo the bill after creation if not already sudoed
+        bills = bills.sudo(self.env.su)
+
+        with profiler.phase('chatter') as phase:
+            poster = self.env.user._is_internal() and self.env.user.id or SUPERUSER_ID
+            title = _("Down payment bill")
+            bills.with_user(poster)._message_post_origin_links()
+            self.env['account.move'].with_user(poster)._message_log_records(purchase_orders.with_user(poster), {
+                order.id: _("%s has been created", bill._get_html_link(title=title))
+                for bill in bills
+                for order in bill.line_ids.purchase_line_id.order_id
+            })
+            phase['rows'] = len(bills) + len(purchase_orders)
+        profiler.save()
+
+        duration = time.perf_counter() - start
+        _logger.info(
+            "%s down payment bill(s) created for %s purchase order(s) in %.2fs (%.1f bills/s)",
+            len(bills), len(purchase_orders), duration, len(bills) / duration if duration else 0.0,
+        )
+        return bills
+
+    def get_down_payment_preview(self):
+        """ Return the down payment lines the wizard would create, and their taxes.
+
+        Nothing is written: the lines are prepared as in :meth:`_create_down_payment_bills`
+        and their taxes are computed in memory, from the base amounts cached on the orders.
+
+        :return: dict with the keys
+            - ``lines``: one dict per down payment line, with the keys ``order_id``, ``name``,
+              ``tax_ids``, ``analytic_distribution``, ``price_unit``, ``amount_tax`` and
+              ``price_total``
+            - ``taxes``: one dict per tax, with the keys ``tax_id``, ``name``, ``base`` and
+              ``amount``
+            - ``amount_untaxed``, ``amount_tax`` and ``amount_total`` of the down payments
+            - ``rounding_delta``: amount added to the bills by the fixed amount rounding
+        :rtype: dict
+        """
+        self.ensure_one()
+        preview = {
+            'lines': [],
+            'taxes': [],
+            'amount_untaxed': 0.0,
+            'amount_tax': 0.0,
+            'amount_total': 0.0,
+            'rounding_delta': 0.0,
+        }
+        if self.advance_payment_method not in ('percentage', 'fixed'):
+            return preview
+
+        taxes = {}
+        for order in self.purchase_order_ids._origin:
+            currency = order.currency_id
+            order_total = 0.0
+            for line_values in self._prepare_down_payment_lines_values(order):
+                tax_results = self.env['account.tax'].browse(line_values['taxes_id']).compute_all(
+                    line_values['price_unit'],
+                    currency=currency,
+                    quantity=1.0,
+                    product=self.product_id,
+                    partner=order.partner_id,
                 )
+                for tax_values in tax_results['taxes']:
+                    tax_split = taxes.setdefault(tax_values['id'], {
+                        'tax_id': tax_values['id'],
+                        'name': tax_values['name'],
+                        'base': 0.0,
+                        'amount': 0.0,
+                    })
+                    tax_split['base'] += tax_values['base']
+                    tax_split['amount'] += tax_values['amount']
+                preview['lines'].append({
+                    'order_id': order.id,
+                    'name': line_values['name'],
+                    'tax_ids': list(line_values['taxes_id']),
+                    'analytic_distribution': line_values['analytic_distribution'],
+                    'price_unit': line_values['price_unit'],
+                    'amount_tax': tax_results['total_included'] - tax_results['total_excluded'],
+                    'price_total': tax_results['total_included'],
+                })
+                preview['amount_untaxed'] += tax_results['total_excluded']
+                order_total += tax_results['total_included']
+            preview['amount_total'] += order_total
+            if self.advance_payment_method == 'fixed':
+                preview['rounding_delta'] += currency.round(self.fixed_amount - order_total)
 
-            down_payment_lines = purchaseOrderline.create(
-                self._prepare_down_payment_lines_values(order)
-            )
+        preview['taxes'] = list(taxes.values())
+        preview['amount_tax'] = preview['amount_total'] - preview['amount_untaxed']
+        return preview
 
-            bill = self.env['account.move'].sudo().create(
-                self._prepare_invoice_values(order, down_payment_lines)
+    def _ensure_down_payment_product(self):
+        # Create deposit product if necessary
+        if not self.product_id:
+            self.company_id.sudo().purchase_down_payment_product_id = self.env['product.product'].create(
+                self._prepare_down_payment_product_values()
             )
+            self._compute_product_id()
 
-            # Ensure the bill total is exactly the expected fixed amount.
-            if self.advance_payment_method == 'fixed':
-                delta_amount = (bill.amount_total - self.fixed_amount) * (1 if bill.is_inbound() else -1)
-                if not order.currency_id.is_zero(delta_amount):
-                    receivable_line = bill.line_ids\
-                        .filtered(lambda aml: aml.account_id.account_type == 'liability_payable')[:1]
-                    product_lines = bill.line_ids\
-                        .filtered(lambda aml: aml.display_type == 'product')
-                    tax_lines = bill.line_ids\
-                        .filtered(lambda aml: aml.tax_line_id.amount_type not in (False, 'fixed'))
-
-                    if product_lines and tax_lines and receivable_line:
-                        line_commands = [Command.update(receivable_line.id, {
-                            'amount_currency': receivable_line.amount_currency + delta_amount,
-                        })]
-                        delta_sign = 1 if delta_amount > 0 else -1
-                        for lines, attr, sign in (
-                            (product_lines, 'price_total', -1),
-                            (tax_lines, 'amount_currency', 1),
-                        ):
-                            remaining = delta_amount
-                            lines_len = len(lines)
-                            for line in lines:
-                                if order.currency_id.compare_amounts(remaining, 0) != delta_sign:
-                                    break
-                                amt = delta_sign * max(
-                                    order.currency_id.rounding,
-                                    abs(order.currency_id.round(remaining / lines_len)),
-                                )
-                                remaining -= amt
-                                line_commands.append(Command.update(line.id, {attr: line[attr] + amt * sign}))
-                        bill.line_ids = line_commands
-
-            # Unsudo the bill after creation if not already sudoed
-            bill = bill.sudo(self.env.su)
+    def _create_billing_job(self):
+        """ Queue the billing of the selected orders in a `purchase.billing.job`.
 
-            poster = self.env.user._is_internal() and self.env.user.id or SUPERUSER_ID
-            bill.with_user(poster).message_post_with_source(
-                'mail.message_origin_link',
-                render_values={'self': bill, 'origin': order},
-                subtype_xmlid='mail.mt_note',
-            )
+        :return: an action opening the job
+        :rtype: dict
+        """
+        self.ensure_one()
+        orders = self._get_purchase_orders()
+        if self.advance_payment_method != 'delivered':
+            self._check_down_payment_selection(orders)
+            self = self.with_company(self.company_id)
+            self._ensure_down_payment_product()
+        job = self.env['purchase.billing.job'].create(self._prepare_billing_job_values())
+        job._trigger_processing()
+        return {
+            'name': _('Bill Generation'),
+            'type': 'ir.actions.act_window',
+            'res_model': 'purchase.billing.job',
+            'res_id': job.id,
+            'view_mode': 'form',
+            'target': 'current',
+        }
 
-            title = _("Down payment bill")
-            order.with_user(poster).message_post(
-                body=_("%s has been created", bill._get_html_link(title=title)),
-            )
+    def _prepare_billing_job_values(self):
+        self.ensure_one()
+        # Keep the orders of a same vendor close to each other, so that consolidated
+        # bills are split over chunks as little as possible.
+        orders = self._get_purchase_orders()
+        if not self.purchase_order_domain:
+            orders = orders.sorted(lambda order: (order.partner_id.id, order.currency_id.id, order.id))
+        return {
+            'company_id': (self.company_id or self.env.company).id,
+            'advance_payment_method': self.advance_payment_method,
+            'deduct_down_payments': self.deduct_down_payments,
+            'consolidated_billing': self.consolidated_billing,
+            'product_id': self.product_id.id,
+            'amount': self.amount,
+            'fixed_amount': self.fixed_amount,
+            'currency_id': self.currency_id.id,
+            'line_ids': [Command.create({'order_id': order.id}) for order in orders],
+        }
 
-            return bill
+    def _apply_fixed_amount_rounding(self, bill, fixed_amount):
+        """ Spread the cents missing (or in excess) to reach `fixed_amount` over the bill lines. """
+        currency = bill.currency_id
+        delta_amount = (bill.amount_total - fixed_amount) * (1 if bill.is_inbound() else -1)
+        if not currency.is_zero(delta_amount):
+            receivable_line = bill.line_ids\
+                .filtered(lambda aml: aml.account_id.account_type == 'liability_payable')[:1]
+            product_lines = bill.line_ids\
+                .filtered(lambda aml: aml.display_type == 'product')
+            tax_lines = bill.line_ids\
+                .filtered(lambda aml: aml.tax_line_id.amount_type not in (False, 'fixed'))
+
+            if product_lines and tax_lines and receivable_line:
+                bill.line_ids = bill._get_rounding_delta_commands(delta_amount, receivable_line, [
+                    (product_lines, 'price_total', -1 if bill.is_inbound() else 1),
+                    (tax_lines, 'amount_currency', 1),
+                ])
 
     def _prepare_down_payment_product_values(self):
         self.ensure_one()
@@ -330,60 +680,17 @@ class purchaseAdvancePaymentInv(models.TransientModel):
         else:
             percentage = self.fixed_amount / order.amount_total if order.amount_total else 1
 
-        order_lines = order.order_line.filtered(lambda l: not l.display_type and not l.mjb_is_downpayment)
         base_downpayment_lines_values = self._prepare_base_downpayment_line_values(order)
-
-        computed_taxes = self.env['account.tax']._compute_taxes([
-                    line._convert_to_tax_base_line_dict()
-                    for line in order_lines
-                ])
-        down_payment_values = []
-        for line, tax_repartition in computed_taxes['base_lines_to_update']:
-            taxes = line['taxes'].flatten_taxes_hierarchy()
-            fixed_taxes = taxes.filtered(lambda tax: tax.amount_type == 'fixed')
-            down_payment_values.append([
-                taxes - fixed_taxes,
-                line['analytic_distribution'],
-                tax_repartition['price_subtotal']
-            ])
-            for fixed_tax in fixed_taxes:
-                # Fixed taxes cannot be set as taxes on down payments as they always amounts to 100%
-                # of the tax amount. Therefore fixed taxes are removed and are replace by a new line
-                # with appropriate amount, and non fixed taxes if the fixed tax affected the base of
-                # any other non fixed tax.
-                if fixed_tax.price_include:
-                    continue
-
-                if fixed_tax.include_base_amount:
-                    pct_tax = taxes[list(taxes).index(fixed_tax) + 1:]\
-                        .filtered(lambda t: t.is_base_affected and t.amount_type != 'fixed')
-                else:
-                    pct_tax = self.env['account.tax']
-                down_payment_values.append([
-                    pct_tax,
-                    line['analytic_distribution'],
-                    line['quantity'] * fixed_tax.amount
-                ])
-
-        downpayment_line_map = {}
-        for taxes_id, analytic_distribution, price_subtotal in down_payment_values:
-            grouping_key = frozendict({
-                'taxes_id': tuple(sorted(taxes_id.ids)),
-                'analytic_distribution': analytic_distribution,
-            })
-            downpayment_line_map.setdefault(grouping_key, {
+        return [
+            {
                 **base_downpayment_lines_values,
-                **grouping_key,
+                'taxes_id': tax_ids,
+                'analytic_distribution': analytic_distribution and dict(analytic_distribution),
                 'product_qty': 0.0,
-                'price_unit': 0.0,
-            })
-            downpayment_line_map[grouping_key]['price_unit'] += price_subtotal
-        for key in downpayment_line_map:
-            downpayment_line_map[key]['price_unit'] = \
-                order.currency_id.round(downpayment_line_map[key]['price_unit'] * percentage)
-
-
-        return list(downpayment_line_map.values())
+                'price_unit': order.currency_id.round(price_subtotal * percentage),
+            }
+            for (tax_ids, analytic_distribution), price_subtotal in order._get_down_payment_base_amounts()
+        ]
 
     def _prepare_base_downpayment_line_values(self, order):
         self.ensure_one()